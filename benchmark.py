@@ -0,0 +1,247 @@
+'''
+Usage:
+python benchmark.py [--scales 1 10 100] [--repeat 3] [--output results.json]
+python benchmark.py --compare [previous results.json]
+'''
+# Program to time and memory-profile each stage of the training pipeline in
+# hmm_trans_emission.py, on the bundled dataset and on synthetically replicated
+# copies of it
+
+import numpy as np
+import argparse
+import json
+import multiprocessing
+import os
+import platform
+import sys
+import tempfile
+import time
+import tracemalloc
+import hmm_trans_emission as hte
+
+# Stages of the training pipeline, in the order they run
+STAGES = ['ingestion','label_encoding','event_extraction','trans_prob',
+          'emission_prob','normalize','artifact_writing']
+
+def read_notes(filenames,processes=None):
+    ''' Read_notes Method
+            Reads the note on/off rows of every piece (see read_chorale_notes in
+            hmm_trans_emission.py), without converting them into events, using
+            a pool of worker processes as load_chorales does
+
+            Args:
+                filenames: 1-D Array of paths to the .csv or .mid files of the
+                           pieces as strings
+                processes: Integer indicating the number of worker processes
+                           (defaults to the number of CPUs). If 1, the pieces
+                           are read in the current process.
+            Returns:
+                rows: List of (times, notes, velocities) tuples, one per piece
+        '''
+    if processes == 1:
+        return [hte.read_chorale_notes(filename) for filename in filenames]
+    with multiprocessing.Pool(processes) as pool:
+        return pool.map(hte.read_chorale_notes,filenames)
+
+def replicate_corpus(filenames,labels_path,scale,output_dir):
+    ''' Replicate_corpus Method
+            Builds the inputs of every stage for a dataset made of scale copies
+            of the bundled dataset, outside of the timed code
+
+            Args:
+                filenames: 1-D Array of paths to the .csv or .mid files of the
+                           pieces as strings
+                labels_path: String indicating the path to the harmonic labels
+                             csv file
+                scale: Integer indicating the number of copies of the dataset
+                output_dir: String indicating the folder the harmonic labels
+                            csv file of the copies is written to
+            Returns:
+                corpus: Dictionary of the inputs of the stages
+                        Keys: 'filenames', 'labels_path', 'times', 'notes',
+                              'velocities' (note on/off rows), 'df_y',
+                              'event_codes', 'lengths_list'
+        '''
+    with open(labels_path) as labels_file:
+        labels_text = labels_file.read()
+    if not labels_text.endswith('\n'):
+        labels_text += '\n'
+    scaled_labels_path = os.path.join(output_dir,'labels-x'+str(scale)+'.csv')
+    with open(scaled_labels_path,'w') as labels_file:
+        labels_file.write(labels_text*scale)
+    rows = [hte.read_chorale_notes(filename) for filename in filenames]
+    times,notes,velocities = [np.concatenate([row[ii] for row in rows])
+                              for ii in range(3)]
+    df_y,event_codes,lengths_list = hte.load_corpus(os.path.dirname(filenames[0]),
+                                                   labels_path,processes=1)
+    n_events = len(event_codes)
+    # Each copy of the dataset starts where the previous copy ends
+    copies_lengths = [np.concatenate(([0],lengths_list)) + ii*n_events
+                      for ii in range(scale)]
+    return {'filenames':list(filenames)*scale,
+            'labels_path':scaled_labels_path,
+            'times':np.tile(times,scale),
+            'notes':np.tile(notes,scale),
+            'velocities':np.tile(velocities,scale),
+            'df_y':np.tile(df_y,scale),
+            'event_codes':np.tile(event_codes,scale),
+            'lengths_list':np.concatenate(copies_lengths)[1:]}
+
+def stage_functions(corpus,processes,output_dir):
+    ''' Stage_functions Method
+            Creates a function without arguments for each stage, running the
+            stage on the replicated dataset
+
+            Args:
+                corpus: Dictionary returned by replicate_corpus
+                processes: Integer indicating the number of worker processes
+                           used by the ingestion stage (reading the note 
+                           on/off rows of the pieces, without converting them
+                           into events)
+                output_dir: String indicating the folder the artifact writing
+                            stage writes to
+            Returns:
+                functions: Dictionary of stage names and functions
+        '''
+    model = hte.hmm_model(len(hte.LABELS),12)
+    model.fit(corpus['df_y'],corpus['event_codes'],corpus['lengths_list'])
+    return {
+        'ingestion':lambda: read_notes(corpus['filenames'],processes),
+        'label_encoding':lambda: hte.load_labels(corpus['labels_path']),
+        'event_extraction':lambda: hte.build_event_list(corpus['times'],
+                                                        corpus['notes'],
+                                                        corpus['velocities']),
+        'trans_prob':lambda: model.count_transitions(corpus['df_y'],
+                                                     corpus['lengths_list']),
+        'emission_prob':lambda: model.count_emissions(corpus['df_y'],
+                                                      corpus['event_codes']),
+        'normalize':model.normalize,
+        'artifact_writing':lambda: hte.save_model(os.path.join(output_dir,
+                                                  hte.MODEL_BUNDLE),model,
+                                                  corpus['df_y'],
+                                                  corpus['event_codes'],
+                                                  corpus['lengths_list'])}
+
+def measure(function,repeat):
+    ''' Measure Method
+            Times a stage and measures its peak memory. The time is the best of
+            repeat runs; the peak memory is measured in a separate run with
+            tracemalloc (which slows the code down) and only covers the current
+            process, not the worker processes of the ingestion stage
+
+            Args:
+                function: Function without arguments running the stage
+                repeat: Integer indicating the number of timed runs
+            Returns:
+                seconds: Float indicating the best time in seconds
+                peak_bytes: Integer indicating the peak memory allocated in bytes
+        '''
+    seconds = float('inf')
+    for ii in range(repeat):
+        start = time.perf_counter()
+        function()
+        seconds = min(seconds,time.perf_counter() - start)
+    tracemalloc.start()
+    function()
+    peak_bytes = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return seconds,peak_bytes
+
+def run_benchmark(corpus_path=hte.CORPUS_PATH,labels_path=hte.LABELS_FILE,
+                  scales=(1,10,100),repeat=3,processes=None,stages=STAGES):
+    ''' Run_benchmark Method
+            Times and memory-profiles every stage at every scale
+
+            Args:
+                corpus_path: String indicating the path to the folder of .csv or
+                             .mid files
+                labels_path: String indicating the path to the harmonic labels
+                             csv file
+                scales: 1-D Array of the numbers of copies of the dataset as ints
+                repeat: Integer indicating the number of timed runs per stage
+                processes: Integer indicating the number of worker processes
+                           used by the ingestion stage
+                stages: 1-D Array of the names of the stages to run as strings
+            Returns:
+                report: Dictionary with information about the machine and a list
+                        of results, one per stage and scale
+        '''
+    filenames = hte.find_pieces(corpus_path)
+    results = []
+    with tempfile.TemporaryDirectory() as output_dir:
+        for scale in scales:
+            corpus = replicate_corpus(filenames,labels_path,scale,output_dir)
+            functions = stage_functions(corpus,processes,output_dir)
+            for stage in stages:
+                seconds,peak_bytes = measure(functions[stage],repeat)
+                results.append({'stage':stage,'scale':scale,
+                                'n_pieces':len(corpus['filenames']),
+                                'n_rows':len(corpus['times']),
+                                'n_events':len(corpus['event_codes']),
+                                'seconds':seconds,
+                                'events_per_second':len(corpus['event_codes'])/seconds,
+                                'peak_bytes':peak_bytes})
+                print('{:>16} x{:<4} {:10.4f} s {:12.1f} MB'.format(
+                      stage,scale,seconds,peak_bytes/2**20),file = sys.stderr)
+    return {'python':platform.python_version(),'numpy':np.__version__,
+            'machine':platform.machine(),'cpus':os.cpu_count(),
+            'processes':processes,'repeat':repeat,'results':results}
+
+def compare(report,previous):
+    ''' Compare Method
+            Prints the speedup of every stage and scale relative to a previous
+            report (values above 1 mean the current report is faster) to
+            stderr
+
+            Args:
+                report: Dictionary returned by run_benchmark
+                previous: Dictionary returned by run_benchmark for an earlier
+                          run
+        '''
+    before = {(result['stage'],result['scale']):result
+              for result in previous['results']}
+    for result in report['results']:
+        key = (result['stage'],result['scale'])
+        if key in before:
+            print('{:>16} x{:<4} speedup {:6.2f} memory {:6.2f}'.format(
+                  result['stage'],result['scale'],
+                  before[key]['seconds']/result['seconds'],
+                  result['peak_bytes']/max(before[key]['peak_bytes'],1)),
+                  file = sys.stderr)
+
+def main(argv=None):
+    ''' Main Method
+            Command line interface: runs the benchmark and writes the JSON
+            report
+        '''
+    parser = argparse.ArgumentParser(description='Benchmark the training pipeline')
+    parser.add_argument('--corpus', type = str, default = hte.CORPUS_PATH,
+                        help = 'Folder of .csv or .mid files of the dataset')
+    parser.add_argument('--labels', type = str, default = hte.LABELS_FILE,
+                        help = 'Harmonic labels csv file')
+    parser.add_argument('--scales', type = int, nargs = '+', default = [1,10,100],
+                        help = 'Numbers of copies of the dataset')
+    parser.add_argument('--repeat', type = int, default = 3,
+                        help = 'Number of timed runs per stage')
+    parser.add_argument('--processes', type = int, default = None,
+                        help = 'Number of worker processes for ingestion')
+    parser.add_argument('--stages', type = str, nargs = '+', default = STAGES,
+                        choices = STAGES, help = 'Stages to run')
+    parser.add_argument('--output', type = str, default = None,
+                        help = 'File to write the JSON report to')
+    parser.add_argument('--compare', type = str, default = None,
+                        help = 'Previous JSON report to compare against')
+    args = parser.parse_args(argv)
+    report = run_benchmark(args.corpus,args.labels,args.scales,args.repeat,
+                           args.processes,args.stages)
+    if args.output is not None:
+        with open(args.output,'w') as output_file:
+            json.dump(report,output_file,indent=2)
+    else:
+        print(json.dumps(report,indent=2))
+    if args.compare is not None:
+        with open(args.compare) as previous_file:
+            compare(report,json.load(previous_file))
+
+if __name__ == '__main__':
+    main()
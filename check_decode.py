@@ -0,0 +1,220 @@
+'''
+Usage:
+python check_decode.py [--pieces 10] [--random-models 20] [--seed 0]
+'''
+# Program to check that the decoding algorithms of hmm_decode.py agree with
+# each other: the sparse, batched, checkpointed and beam-pruned Viterbi
+# algorithms and the stream decoder (without a lag limit) must find the same
+# path as hmm_decoder.viterbi, and forward_backward must match a log-space
+# reference. Runs on the model bundle written by hmm_trans_emission.py and on
+# small random models
+
+import numpy as np
+import argparse
+import hmm_trans_emission as hte
+from hmm_decode import hmm_decoder,stream_decoder
+
+def check(condition,message):
+    ''' Check Method
+            Raises an AssertionError (even when Python runs with -O) if a check
+            fails
+
+            Args:
+                condition: Boolean result of the check
+                message: String describing the check
+        '''
+    if not condition:
+        raise AssertionError(message)
+
+def random_decoder(rng,n_states=12,density=0.2):
+    ''' Random_decoder Method
+            Creates the decoder of a small random model whose unobserved
+            transitions have the eps floor probability, as in the trained model.
+            The small integer counts make ties between paths likely
+
+            Args:
+                rng: numpy.random.Generator
+                n_states: Integer indicating the number of states
+                density: Float indicating the fraction of observed transitions
+            Returns:
+                decoder: hmm_decoder of the random model
+        '''
+    model = hte.hmm_model(n_states,12)
+    model.trans_counts = (rng.integers(1,4,(n_states,n_states))*
+                          (rng.random((n_states,n_states)) < density)).astype(float)
+    # A state without any observed successor
+    model.trans_counts[rng.integers(n_states)] = 0
+    model.state_counts = np.full(n_states,8.0)
+    model.emission_counts = rng.integers(0,9,(n_states,12)).astype(float)
+    return hmm_decoder(model.trans_mat,model.emission_mat)
+
+def reference_forward_backward(decoder,codes):
+    ''' Reference_forward_backward Method
+            Forward-backward algorithm computed directly in log space (base 2),
+            one state at a time, without the scaling of
+            hmm_decoder.forward_backward_batch
+
+            Args:
+                decoder: hmm_decoder
+                codes: 1-D Array of packed observations
+            Returns:
+                posteriors: 2-D Array of posterior probabilities
+                            Shape: [n_examples,n_labels]
+                log_likelihood: Float log probability (base 2) of the
+                                observations
+        '''
+    n_obs = len(codes)
+    log_emit = decoder.log_emission_table[codes]
+    log_alpha = np.zeros((n_obs,decoder.n_states))
+    log_beta = np.zeros((n_obs,decoder.n_states))
+    log_alpha[0] = decoder.log_start + log_emit[0]
+    for t in range(1,n_obs):
+        for jj in range(decoder.n_states):
+            log_alpha[t,jj] = (np.logaddexp2.reduce(log_alpha[t-1] + decoder.log_trans[:,jj])
+                               + log_emit[t,jj])
+    for t in range(n_obs-2,-1,-1):
+        for ii in range(decoder.n_states):
+            log_beta[t,ii] = np.logaddexp2.reduce(decoder.log_trans[ii] + log_emit[t+1]
+                                                  + log_beta[t+1])
+    log_likelihood = np.logaddexp2.reduce(log_alpha[-1])
+    return np.exp2(log_alpha + log_beta - log_likelihood),float(log_likelihood)
+
+def check_viterbi(decoder,pieces,name):
+    ''' Check_viterbi Method
+            Checks that sparse_viterbi, viterbi_batch, checkpointed viterbi and
+            beam_viterbi (with a margin that prunes nothing) find the same paths
+            as viterbi, including for pieces without any events
+
+            Args:
+                decoder: hmm_decoder
+                pieces: List of 1-D Arrays of packed observations
+                name: String naming the model in the error messages
+        '''
+    pieces = list(pieces) + [np.zeros(0,dtype=np.uint16)]
+    exact = [decoder.viterbi(codes) for codes in pieces]
+    for ii,codes in enumerate(pieces):
+        check(np.array_equal(decoder.sparse_viterbi(codes),exact[ii]),
+              name+': sparse_viterbi differs from viterbi on piece '+str(ii))
+        for checkpoint in (1,5,'auto'):
+            check(np.array_equal(decoder.viterbi(codes,checkpoint),exact[ii]),
+                  name+': viterbi with checkpoint '+str(checkpoint)+
+                  ' differs from viterbi on piece '+str(ii))
+        check(np.array_equal(decoder.beam_viterbi(codes,margin=np.inf),exact[ii]),
+              name+': beam_viterbi without pruning differs from viterbi on piece '+str(ii))
+        # A pruned path can never be more probable than the exact path
+        beam_path = decoder.beam_viterbi(codes,beam=2)
+        check(decoder.log_prob(codes,beam_path) <= decoder.log_prob(codes,exact[ii]) + 1e-9,
+              name+': beam_viterbi found a path more probable than viterbi on piece '+str(ii))
+    for batch_size in (1,3,len(pieces)):
+        paths = decoder.viterbi_batch(pieces,batch_size)
+        check(all(np.array_equal(path,path_exact) for path,path_exact in zip(paths,exact)),
+              name+': viterbi_batch with batch_size '+str(batch_size)+' differs from viterbi')
+    check(decoder.viterbi_batch([np.zeros(0,dtype=np.uint16)])[0].shape == (0,),
+          name+': viterbi_batch of an empty piece is not empty')
+
+def check_forward_backward(decoder,pieces,name,tolerance=1e-9):
+    ''' Check_forward_backward Method
+            Checks the posteriors and log-likelihoods of forward_backward and
+            forward_backward_batch against reference_forward_backward
+
+            Args:
+                decoder: hmm_decoder
+                pieces: List of 1-D Arrays of packed observations
+                name: String naming the model in the error messages
+                tolerance: Float indicating the largest difference allowed
+        '''
+    posteriors,log_likelihoods = decoder.forward_backward_batch(pieces)
+    for ii,codes in enumerate(pieces):
+        expected,expected_log_likelihood = reference_forward_backward(decoder,codes)
+        single,log_likelihood = decoder.forward_backward(codes)
+        for result,result_log_likelihood in ((single,log_likelihood),
+                                             (posteriors[ii],log_likelihoods[ii])):
+            check(np.max(np.abs(result - expected)) < tolerance,
+                  name+': forward_backward posteriors differ from the reference on piece '+str(ii))
+            check(abs(result_log_likelihood - expected_log_likelihood) <
+                  tolerance*max(1,abs(expected_log_likelihood)),
+                  name+': forward_backward log-likelihood differs from the reference on piece '+str(ii))
+
+def check_stream(decoder,filenames,lags=(None,0,1,8)):
+    ''' Check_stream Method
+            Streams the notes of pieces through stream_decoder, once more with
+            every label committed halfway through the piece. Checks that every
+            event is committed exactly once and in order, that at most lag 
+            events are left uncommitted with one backpointer less than 
+            uncommitted events, and that without a lag limit the labels are 
+            those of viterbi on the parsed piece
+
+            Args:
+                decoder: hmm_decoder
+                filenames: 1-D Array of paths to the .csv or .mid files of the
+                           pieces as strings
+                lags: 1-D Array of the lags to check
+        '''
+    for filename in filenames:
+        times,notes,velocities = hte.read_chorale_notes(filename)
+        exact = decoder.viterbi(hte.parse_chorale(filename))
+        for lag,halfway in [(lag,False) for lag in lags] + [(lags[-1],True)]:
+            stream = stream_decoder(decoder,lag)
+            committed = []
+            for ii,(time,note,velocity) in enumerate(zip(times,notes,velocities)):
+                committed += stream.push(int(time),int(note),int(velocity))
+                if halfway and ii == len(times)//2:
+                    committed += stream.commit(stream.n_events - stream.n_committed)
+                n_uncommitted = stream.n_events - stream.n_committed
+                check(len(stream.backpointers) == max(n_uncommitted-1,0),
+                      filename+': stream_decoder with lag '+str(lag)+
+                      ' keeps '+str(len(stream.backpointers))+' backpointers for '+
+                      str(n_uncommitted)+' uncommitted events')
+                check(lag is None or n_uncommitted <= max(lag,1),
+                      filename+': stream_decoder left more than lag '+str(lag)+
+                      ' events uncommitted')
+            committed += stream.flush()
+            check([index for index,label in committed] == list(range(len(exact))),
+                  filename+': stream_decoder with lag '+str(lag)+
+                  ' did not commit every event once and in order')
+            if lag is None and not halfway:
+                check(np.array_equal([label for index,label in committed],exact),
+                      filename+': stream_decoder without a lag limit differs from viterbi')
+
+def main(argv=None):
+    ''' Main Method
+            Command line interface: runs every check and reports the first
+            failure
+        '''
+    parser = argparse.ArgumentParser(description='Check the decoding algorithms')
+    parser.add_argument('--model', type = str, default = hte.MODEL_BUNDLE,
+                        help = 'Model bundle written by hmm_trans_emission.py')
+    parser.add_argument('--corpus', type = str, default = hte.CORPUS_PATH,
+                        help = 'Folder of .csv or .mid files streamed through stream_decoder')
+    parser.add_argument('--pieces', type = int, default = 10,
+                        help = 'Number of pieces of the dataset to check')
+    parser.add_argument('--random-models', type = int, default = 20,
+                        help = 'Number of small random models to check')
+    parser.add_argument('--seed', type = int, default = 0,
+                        help = 'Seed of the random models and observations')
+    args = parser.parse_args(argv)
+    rng = np.random.default_rng(args.seed)
+
+    bundle = hte.load_model_bundle(args.model)
+    decoder = hmm_decoder(bundle['trans_mat'],bundle['emission_mat'])
+    pieces = np.split(np.asarray(bundle['event_codes']),bundle['lengths_list'])[:args.pieces]
+    check_viterbi(decoder,pieces,args.model)
+    print('Viterbi variants agree on '+str(len(pieces))+' pieces')
+    # The reference visits every pair of states, so only short pieces are used
+    check_forward_backward(decoder,[codes[:40] for codes in pieces[:3]],args.model)
+    print('Forward-backward matches the log-space reference')
+    filenames = hte.find_pieces(args.corpus)[:args.pieces]
+    check_stream(decoder,filenames)
+    print('Stream decoder agrees on '+str(len(filenames))+' pieces')
+
+    for ii in range(args.random_models):
+        random = random_decoder(rng)
+        name = 'random model '+str(ii)
+        pieces = [rng.integers(0,2**12,length).astype(np.uint16)
+                  for length in rng.integers(1,60,4)]
+        check_viterbi(random,pieces,name)
+        check_forward_backward(random,pieces,name)
+    print('Checks passed on '+str(args.random_models)+' random models')
+
+if __name__ == '__main__':
+    main()
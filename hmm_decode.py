@@ -0,0 +1,697 @@
+'''
+Usage:
+from hmm_decode import hmm_decoder
+'''
+# Decoding algorithms for the HMM generated by the hmm_trans_emission.py program
+
+import numpy as np
+from hmm_trans_emission import pack_events,sparse_from_dense
+
+def pad_observations(sequences):
+    ''' Pad_observations Method
+            Packs the observations of several pieces of different lengths into 
+            a single padded array, so that they can be processed together 
+            
+            Args:
+                sequences: List of the observations of each piece, as 2-D numpy
+                           arrays (Shape: [n_features=12,n_examples]) or 1-D 
+                           Arrays of packed observations (see pack_events)
+            Returns:
+                codes: 2-D Array of packed observations, padded with 0 after the
+                       end of each piece 
+                       Shape: [n_pieces,max_examples]
+                lengths: 1-D Array of the number of observations of each piece
+                         Shape: [n_pieces]
+    '''
+    sequences = [np.asarray(obs) for obs in sequences]
+    sequences = [pack_events(obs) if obs.ndim == 2 else obs for obs in sequences]
+    lengths = np.array([len(obs) for obs in sequences],dtype=int)
+    codes = np.zeros((len(sequences),max(lengths,default=0)),dtype=np.uint16)
+    for ii,obs in enumerate(sequences):
+        codes[ii,:lengths[ii]] = obs
+    return codes,lengths
+
+class hmm_decoder:
+    ''' Hmm_decoder Class
+            Precomputes the log-space (base 2) start, transition and emission
+            tables of the HMM once, so that every decoding step is a single
+            vectorized operation over all the states
+
+            Args:
+                trans_mat: 2-D Array of transition probabilities, where
+                           trans_mat[ii][jj] is the probability of transitioning
+                           from initial state ii to final state jj
+                           Shape: [n_labels,n_labels]
+                emission_mat: 2-D Array of emission probabilities, where
+                              emission_mat[ii][jj] is the probability of
+                              observing MIDI note mod 12 jj given the current
+                              state ii
+                              Shape: [n_labels,n_features=12]
+                start_p: 1-D Array of start probabilities (defaults to a uniform
+                         distribution over the states)
+                         Shape: [n_labels]
+    '''
+    def __init__(self,trans_mat,emission_mat,start_p=None):
+        self.trans_mat = np.ascontiguousarray(trans_mat,dtype=float)
+        self.emission_mat = np.ascontiguousarray(emission_mat,dtype=float)
+        self.n_states = self.trans_mat.shape[0]
+        self.states = np.arange(self.n_states)
+        if start_p is None:
+            start_p = np.full(self.n_states,1/self.n_states)
+        self.start_p = np.asarray(start_p,dtype=float)
+        self.log_start = np.log2(self.start_p)
+        self.log_trans = np.log2(self.trans_mat)
+        # log_trans_t[jj,ii] is the log probability of transitioning from 
+        # state ii to state jj, so that the maximum over the previous states 
+        # runs along the last (contiguous) axis 
+        self.log_trans_t = np.ascontiguousarray(self.log_trans.T)
+        # Observed transitions in sparse form, grouped by the state they lead 
+        # to, for sparse_viterbi 
+        self.trans_sparse = sparse_from_dense(self.trans_mat)
+        predecessors = self.trans_sparse.transpose()
+        self.pred_from = predecessors.indices
+        self.pred_log = np.log2(predecessors.data)
+        self.pred_has = np.diff(predecessors.indptr) > 0
+        self.pred_starts = predecessors.indptr[:-1][self.pred_has]
+        self.log_floor = np.log2(self.trans_sparse.floor)
+        # Smallest integer type holding every state (uint8 for 144 labels)
+        self.backpointer_dtype = np.min_scalar_type(self.n_states-1)
+        self.emission_table = self.build_emission_table()
+        self.log_emission_table = np.log2(self.emission_table)
+
+    def build_emission_table(self):
+        ''' Build_emission_table Method
+                Computes the emission probability of every possible packed
+                event (see pack_events in hmm_trans_emission.py) given every 
+                state, so that scoring an observation is a single row lookup.
+                As in the original viterbiL, the probability of an observation
+                is the product of the probabilities of the notes present in it;
+                the product is built one note at a time over all the packed 
+                events at once 
+                
+                Returns:
+                    emission_table: 2-D Array of emission probabilities
+                                    Shape: [2**n_features,n_labels]
+        '''
+        n_features = self.emission_mat.shape[1]
+        codes = np.arange(2**n_features)
+        probs = np.ones((len(codes),self.n_states))
+        for jj in range(n_features):
+            probs[(codes >> jj) & 1 == 1] *= self.emission_mat[:,jj]
+        return probs
+
+    def log_emissions(self,obs):
+        ''' Log_emissions Method
+                Looks up the log emission probability of every observation given
+                every state in the precomputed table 
+
+                Args:
+                    obs: 2-D numpy array of observations, where observations are
+                         the presence/absence of notes (for each of the 12 notes
+                         in the chromatic scale, with 1 indicating presence and
+                         0 indicating absence)
+                         Shape: [n_features=12,n_examples]
+                         or the 1-D Array of packed observations returned by 
+                         pack_events 
+                         Shape: [n_examples]
+                Returns:
+                    log_emit: 2-D Array of log emission probabilities
+                              Shape: [n_examples,n_labels]
+        '''
+        obs = np.asarray(obs)
+        if obs.ndim == 2:
+            obs = pack_events(obs)
+        return self.log_emission_table[obs]
+
+    def viterbi_steps(self,codes,scores,first,last,backpointers=None):
+        ''' Viterbi_steps Method
+                Runs steps first to last-1 of the Viterbi recursion. Each step 
+                takes the maximum over all (previous state, state) pairs with a
+                single broadcast into a reused buffer, and looks up the log 
+                emission probabilities of the packed observation in the 
+                precomputed table 
+                
+                Args:
+                    codes: 1-D Array of packed observations 
+                           Shape: [n_examples]
+                    scores: 1-D Array of the log probabilities of the best paths
+                            ending in each state at step first-1 
+                            Shape: [n_labels]
+                    first, last: Integers indicating the steps to run 
+                    backpointers: 2-D Array to store the backpointers of the 
+                                  steps in (row t-first for step t), or None 
+                                  Shape: [last-first,n_labels]
+                Returns:
+                    scores: 1-D Array of the log probabilities of the best paths
+                            ending in each state at step last-1 
+        '''
+        scores = np.array(scores,dtype=float)
+        candidates = np.empty((self.n_states,self.n_states))
+        for t in range(first,last):
+            # candidates[jj,ii] is the score of reaching state jj from state ii
+            np.add(scores[np.newaxis,:],self.log_trans_t,out=candidates)
+            best = np.argmax(candidates,axis=1)
+            if backpointers is not None:
+                backpointers[t-first] = best
+            np.add(candidates[self.states,best],self.log_emission_table[codes[t]],
+                   out=scores)
+        return scores
+
+    def viterbi(self,obs,checkpoint=None):
+        ''' Viterbi Algorithm in Log-Space
+                Finds the most likely sequence of states for the input
+                observations. The backpointers are kept in a compact integer 
+                array (uint8 for 144 labels) and the path is followed back from 
+                the most probable final state. 
+                In checkpointed mode, only the scores of every checkpoint-th 
+                step are kept on a first pass; the backpointers are then 
+                recomputed one segment at a time from the end, so memory grows 
+                with sqrt(n_examples) instead of n_examples, at the cost of 
+                running the recursion twice. Both modes give the same path 
+
+                Args:
+                    obs: 2-D numpy array of observations
+                         Shape: [n_features=12,n_examples]
+                         or 1-D Array of packed observations 
+                         Shape: [n_examples]
+                    checkpoint: Integer (at least 1) indicating the number of
+                                steps between checkpoints, 'auto' for 
+                                sqrt(n_examples), or None to keep every 
+                                backpointer (default)
+                Returns:
+                    path: 1-D numpy array of the predicted labels as ints
+                          Shape: [n_examples]
+        '''
+        if not (checkpoint is None or (isinstance(checkpoint,str) and checkpoint == 'auto') or
+                (isinstance(checkpoint,(int,np.integer)) and not isinstance(checkpoint,bool)
+                 and checkpoint >= 1)):
+            raise ValueError("checkpoint must be None, 'auto' or an integer of at least 1, not "
+                             +repr(checkpoint))
+        codes = np.asarray(obs)
+        if codes.ndim == 2:
+            codes = pack_events(codes)
+        n_obs = len(codes)
+        if n_obs == 0:
+            return np.zeros(0,dtype=int)
+        scores = self.log_start + self.log_emission_table[codes[0]]
+        path = np.zeros(n_obs,dtype=int)
+        if checkpoint is None:
+            backpointers = np.zeros((n_obs,self.n_states),dtype=self.backpointer_dtype)
+            scores = self.viterbi_steps(codes,scores,1,n_obs,backpointers[1:])
+            # Follow the backpointers from the most probable final state
+            path[-1] = np.argmax(scores)
+            for t in range(n_obs-1,0,-1):
+                path[t-1] = backpointers[t,path[t]]
+            return path
+        if checkpoint == 'auto':
+            checkpoint = int(np.ceil(np.sqrt(n_obs)))
+        # First pass: keep the scores of steps 0, checkpoint, 2*checkpoint...
+        n_checkpoints = (n_obs-1)//checkpoint + 1
+        checkpoint_scores = np.zeros((n_checkpoints,self.n_states))
+        checkpoint_scores[0] = scores
+        for mm in range(1,n_checkpoints):
+            scores = self.viterbi_steps(codes,scores,(mm-1)*checkpoint+1,
+                                        mm*checkpoint+1)
+            checkpoint_scores[mm] = scores
+        scores = self.viterbi_steps(codes,scores,(n_checkpoints-1)*checkpoint+1,n_obs)
+        path[-1] = np.argmax(scores)
+        # Second pass: recompute the backpointers of the steps following each
+        # checkpoint, from the last checkpoint to the first, and follow them 
+        # from the state already found at the end of the segment 
+        backpointers = np.zeros((checkpoint,self.n_states),dtype=self.backpointer_dtype)
+        for mm in range(n_checkpoints-1,-1,-1):
+            start = mm*checkpoint
+            end = min(start+checkpoint,n_obs-1)
+            self.viterbi_steps(codes,checkpoint_scores[mm],start+1,end+1,backpointers)
+            for t in range(end,start,-1):
+                path[t-1] = backpointers[t-start-1,path[t]]
+        return path
+
+    def sparse_viterbi(self,obs):
+        ''' Sparse Viterbi Algorithm 
+                Finds the same sequence of states as the viterbi method, but 
+                each step only scores the observed transitions (see 
+                sparse_matrix in hmm_trans_emission.py), so its cost grows with
+                the number of observed transitions instead of n_labels**2. All
+                the other transitions have the floor probability, so the best 
+                of them into any state comes from the best previous state 
+                overall; it is compared with the best observed transition. 
+                Instead of backpointers, the scores of every step are kept (8 
+                bytes instead of 1 per state and event), and the best previous
+                state of each state on the path is recomputed from them while 
+                following the path back, as the viterbi method would choose it.
+                With the 671 observed transitions of the 144 labels, it decodes
+                about twice as fast as the viterbi method 
+                
+                Args:
+                    obs: 2-D numpy array of observations or 1-D Array of packed 
+                         observations (see viterbi)
+                Returns:
+                    path: 1-D numpy array of the predicted labels as ints
+                          Shape: [n_examples]
+        '''
+        codes = np.asarray(obs)
+        if codes.ndim == 2:
+            codes = pack_events(codes)
+        n_obs = len(codes)
+        if n_obs == 0:
+            return np.zeros(0,dtype=int)
+        # history[t] holds the scores of the best paths ending in each state at
+        # step t 
+        history = np.zeros((n_obs,self.n_states))
+        # Best observed transition into every state (-inf for the states 
+        # without any observed predecessor) 
+        best = np.full(self.n_states,-np.inf)
+        scores = history[0]
+        np.add(self.log_start,self.log_emission_table[codes[0]],out=scores)
+        for t in range(1,n_obs):
+            if len(self.pred_from) > 0:
+                candidates = scores[self.pred_from]
+                candidates += self.pred_log
+                best[self.pred_has] = np.maximum.reduceat(candidates,self.pred_starts)
+            # Compare with the best transition with the floor probability 
+            scores = np.maximum(best,np.max(scores) + self.log_floor,out=history[t])
+            scores += self.log_emission_table[codes[t]]
+        path = np.zeros(n_obs,dtype=int)
+        state = np.argmax(scores)
+        path[-1] = state
+        for t in range(n_obs-1,0,-1):
+            # Best previous state of the state of the path at step t (the first
+            # among ties, as in the viterbi method) 
+            state = (history[t-1] + self.log_trans_t[state]).argmax()
+            path[t-1] = state
+        return path
+
+    def viterbi_batch(self,sequences,batch_size=8):
+        ''' Viterbi Algorithm for a Batch of Pieces 
+                Decodes many pieces together: the pieces are sorted by length 
+                and padded to the same length (see pad_observations), and every
+                step of the recursion processes all the pieces of a batch that 
+                have not yet ended at once. The paths are identical to decoding
+                each piece with the viterbi method 
+                
+                Args:
+                    sequences: List of the observations of each piece (see 
+                               pad_observations); Ex: the pieces of event_codes
+                               split at lengths_list 
+                    batch_size: Integer indicating the number of pieces decoded
+                                at once (each step holds an array of 
+                                batch_size*n_labels*n_labels scores)
+                Returns:
+                    paths: List of 1-D numpy arrays of the predicted labels of 
+                           each piece as ints 
+        '''
+        sequences = [np.asarray(obs) for obs in sequences]
+        sequences = [pack_events(obs) if obs.ndim == 2 else obs for obs in sequences]
+        paths = [None]*len(sequences)
+        # Longest pieces first, so that the pieces still running at any step 
+        # of a batch are the first n_running pieces 
+        order = np.argsort([-len(obs) for obs in sequences],kind='stable')
+        for first in range(0,len(sequences),batch_size):
+            batch = order[first:first+batch_size]
+            codes,lengths = pad_observations([sequences[ii] for ii in batch])
+            n_pieces,n_obs = codes.shape
+            # Pieces without any events (only in the last batches, since the 
+            # longest pieces come first) have empty paths 
+            if n_obs == 0:
+                for ii in batch:
+                    paths[ii] = np.zeros(0,dtype=int)
+                continue
+            log_emit = self.log_emission_table[codes]
+            backpointers = np.zeros((n_pieces,n_obs,self.n_states),
+                                    dtype=self.backpointer_dtype)
+            final_scores = np.zeros((n_pieces,self.n_states))
+            # The candidate scores of every step are written into one buffer
+            buffer = np.empty((n_pieces,self.n_states,self.n_states))
+            scores = self.log_start + log_emit[:,0]
+            for t in range(1,n_obs):
+                n_running = np.count_nonzero(lengths > t)
+                # Keep the final scores of the pieces that ended at t-1 
+                final_scores[n_running:len(scores)] = scores[n_running:]
+                # candidates[kk,jj,ii] is the score of reaching state jj from 
+                # state ii in piece kk 
+                candidates = np.add(scores[:n_running,np.newaxis,:],self.log_trans_t,
+                                    out=buffer[:n_running])
+                best = np.argmax(candidates,axis=2)
+                backpointers[:n_running,t] = best
+                scores = (np.take_along_axis(candidates,best[:,:,np.newaxis],axis=2)[:,:,0]
+                          + log_emit[:n_running,t])
+            final_scores[:len(scores)] = scores
+            for kk in range(n_pieces):
+                path = np.zeros(lengths[kk],dtype=int)
+                if lengths[kk] > 0:
+                    path[-1] = np.argmax(final_scores[kk])
+                for t in range(lengths[kk]-1,0,-1):
+                    path[t-1] = backpointers[kk,t,path[t]]
+                paths[batch[kk]] = path
+        return paths
+
+    def prune(self,scores,beam=None,margin=None):
+        ''' Prune Method
+                Selects the states kept by the beam of beam_viterbi 
+                
+                Args:
+                    scores: 1-D Array of the log probabilities of the best paths
+                            ending in each state 
+                            Shape: [n_labels]
+                    beam: Integer indicating the maximum number of states kept 
+                          (defaults to no limit)
+                    margin: Float indicating the maximum difference (in bits, 
+                            i.e. log base 2) between the score of a kept state 
+                            and the best score (defaults to no limit)
+                Returns:
+                    active: 1-D Array of the kept states, in increasing order 
+        '''
+        if margin is None:
+            if beam is None or beam >= self.n_states:
+                return self.states
+            # The top beam states, without copying the scores first 
+            active = np.argpartition(scores,self.n_states-beam)[self.n_states-beam:]
+            active.sort()
+            return active
+        active = np.flatnonzero(scores >= np.max(scores) - margin)
+        if beam is not None and beam < len(active):
+            best = np.argpartition(scores[active],len(active)-beam)[len(active)-beam:]
+            active = np.sort(active[best])
+        return active
+
+    def beam_viterbi(self,obs,beam=None,margin=None):
+        ''' Beam-Pruned Viterbi Algorithm 
+                Approximates the viterbi method by extending, at each step, only
+                the paths ending in the top beam states and/or in the states 
+                within margin of the best score, so each step scores 
+                n_kept*n_labels instead of n_labels*n_labels pairs. Instead of 
+                n_labels backpointers per step, only the kept states and their 
+                scores are stored; the best previous state of each state on the
+                path is recomputed while following the path back (one row of 
+                log_trans_t per step). The result may differ from the exact 
+                decoding (see log_prob to compare them); without a beam or 
+                margin it is exact 
+                
+                Args:
+                    obs: 2-D numpy array of observations
+                         Shape: [n_features=12,n_examples]
+                         or 1-D Array of packed observations 
+                         Shape: [n_examples]
+                    beam: Integer (at least 1) indicating the number of states 
+                          kept per step
+                    margin: Float (at least 0) indicating the maximum difference
+                            (in bits) between the scores of kept states and the
+                            best score
+                Returns:
+                    path: 1-D numpy array of the predicted labels as ints
+                          Shape: [n_examples]
+        '''
+        if beam is not None and beam < 1:
+            raise ValueError('beam must be at least 1, not '+str(beam))
+        if margin is not None and margin < 0:
+            raise ValueError('margin must be at least 0, not '+str(margin))
+        if margin is None and (beam is None or beam >= self.n_states):
+            return self.viterbi(obs)
+        codes = np.asarray(obs)
+        if codes.ndim == 2:
+            codes = pack_events(codes)
+        n_obs = len(codes)
+        if n_obs == 0:
+            return np.zeros(0,dtype=int)
+        # kept[t] holds the states kept at step t and their scores 
+        kept = [None]*n_obs
+        # The candidate scores of every step are written into one buffer 
+        buffer = np.empty(self.n_states*self.n_states)
+        scores = self.log_start + self.log_emission_table[codes[0]]
+        for t in range(1,n_obs):
+            active = self.prune(scores,beam,margin)
+            kept[t-1] = (active,scores[active])
+            # candidates[ii,jj] is the score of reaching state jj from the 
+            # ii-th kept state 
+            candidates = buffer[:len(active)*self.n_states].reshape(len(active),
+                                                                    self.n_states)
+            np.add(self.log_trans[active],kept[t-1][1][:,np.newaxis],out=candidates)
+            scores = np.max(candidates,axis=0)
+            scores += self.log_emission_table[codes[t]]
+        path = np.zeros(n_obs,dtype=int)
+        state = np.argmax(scores)
+        path[-1] = state
+        for t in range(n_obs-1,0,-1):
+            # Best kept state leading to the state of the path at step t (the
+            # first among ties, as in the viterbi method) 
+            active,active_scores = kept[t-1]
+            row = self.log_trans_t[state]
+            state = active[(active_scores + row[active]).argmax()]
+            path[t-1] = state
+        return path
+
+    def log_prob(self,obs,path):
+        ''' Log_prob Method
+                Computes the joint log probability (base 2) of a sequence of 
+                states and the observations 
+                
+                Args:
+                    obs: 2-D numpy array of observations or 1-D Array of packed 
+                         observations (see viterbi)
+                    path: 1-D Array of states as ints 
+                          Shape: [n_examples]
+                Returns:
+                    log_prob: Float log probability of the path 
+        '''
+        path = np.asarray(path,dtype=int)
+        if len(path) == 0:
+            return 0.0
+        log_emit = self.log_emissions(obs)
+        return float(self.log_start[path[0]] + np.sum(log_emit[np.arange(len(path)),path])
+                     + np.sum(self.log_trans[path[:-1],path[1:]]))
+
+    def forward_backward_batch(self,sequences):
+        ''' Forward-Backward Algorithm for a Batch of Pieces 
+                Computes the posterior probability of every label at every event
+                and the log-likelihood of every piece. The pieces are padded to
+                the same length and every step of the forward and backward 
+                recursions processes all the pieces and states at once; the 
+                forward probabilities are scaled to sum to 1 at every step (and
+                the backward probabilities by the same factors) to avoid 
+                underflow 
+                
+                Args:
+                    sequences: List of the observations of each piece (see 
+                               pad_observations)
+                Returns:
+                    posteriors: List of 2-D Arrays of posterior probabilities, 
+                                one per piece, where posteriors[kk][t][jj] is 
+                                the probability of label jj at event t given all
+                                the observations of piece kk 
+                                Shape: [n_examples,n_labels]
+                    log_likelihoods: 1-D Array of the log probabilities (base 2)
+                                     of the observations of each piece 
+                                     Shape: [n_pieces]
+        '''
+        codes,lengths = pad_observations(sequences)
+        n_pieces,n_obs = codes.shape
+        if n_obs == 0:
+            return [np.zeros((0,self.n_states)) for ii in range(n_pieces)],np.zeros(n_pieces)
+        # mask[kk,t] is True for the events of piece kk (not the padding)
+        mask = np.arange(n_obs) < lengths[:,np.newaxis]
+        emit = self.emission_table[codes]
+        alpha = np.zeros((n_pieces,n_obs,self.n_states))
+        scale = np.ones((n_pieces,n_obs))
+        forward = self.start_p*emit[:,0]
+        for t in range(n_obs):
+            if t > 0:
+                forward = (alpha[:,t-1] @ self.trans_mat)*emit[:,t]
+            # The padding of finished pieces is neither scaled nor counted 
+            scale[:,t] = np.where(mask[:,t],forward.sum(axis=1),1)
+            alpha[:,t] = forward/scale[:,t,np.newaxis]
+        beta = np.ones((n_pieces,n_obs,self.n_states))
+        for t in range(n_obs-2,-1,-1):
+            backward = ((emit[:,t+1]*beta[:,t+1]) @ self.trans_mat.T)/scale[:,t+1,np.newaxis]
+            # The last event of each piece keeps a backward probability of 1
+            beta[:,t] = np.where(mask[:,t+1,np.newaxis],backward,1)
+        gamma = alpha*beta
+        gamma /= gamma.sum(axis=2,keepdims=True)
+        log_likelihoods = np.sum(np.log2(scale),axis=1)
+        return [gamma[kk,:lengths[kk]] for kk in range(n_pieces)],log_likelihoods
+
+    def forward_backward(self,obs):
+        ''' Forward-Backward Algorithm 
+                Computes the posterior probability of every label at every event
+                of a single piece (see forward_backward_batch) 
+                
+                Args:
+                    obs: 2-D numpy array of observations or 1-D Array of packed 
+                         observations (see viterbi)
+                Returns:
+                    posteriors: 2-D Array of posterior probabilities 
+                                Shape: [n_examples,n_labels]
+                    log_likelihood: Float log probability (base 2) of the 
+                                    observations 
+        '''
+        posteriors,log_likelihoods = self.forward_backward_batch([obs])
+        return posteriors[0],float(log_likelihoods[0])
+
+    def posterior_decode(self,obs):
+        ''' Posterior Decoding 
+                Predicts the label of every event that is most probable given 
+                all the observations (unlike the viterbi method, which predicts
+                the most probable sequence of labels) 
+                
+                Args:
+                    obs: 2-D numpy array of observations or 1-D Array of packed 
+                         observations (see viterbi)
+                Returns:
+                    path: 1-D numpy array of the predicted labels as ints 
+                    confidence: 1-D Array of the posterior probabilities of the
+                                predicted labels 
+        '''
+        posteriors,_ = self.forward_backward(obs)
+        path = np.argmax(posteriors,axis=1)
+        return path,posteriors[np.arange(len(path)),path]
+
+class stream_decoder:
+    ''' Stream_decoder Class
+            Labels a live stream of MIDI note on/off events with an online, 
+            fixed-lag Viterbi algorithm. The notes present are kept in a 
+            running count for each of the 12 MIDI notes mod 12 and grouped into
+            events exactly as build_event_list in hmm_trans_emission.py does, 
+            and the Viterbi scores are updated once per event. The label of an
+            event is committed as soon as every surviving path agrees on it, or
+            at the latest once lag newer events have been seen (then following
+            the currently most probable path), so only the backpointers of at 
+            most lag uncommitted events are kept, regardless of the length of 
+            the piece 
+            
+            Args:
+                decoder: hmm_decoder holding the tables of the HMM 
+                lag: Integer indicating the maximum number of events whose 
+                     labels are not yet committed (0 commits the label of each
+                     event as soon as it is seen). If None, labels are only 
+                     committed once all the paths agree on them or the stream 
+                     is flushed, and memory is no longer bounded 
+    '''
+    def __init__(self,decoder,lag=8):
+        self.decoder = decoder
+        self.lag = lag
+        self.states = decoder.states
+        self.n_features = decoder.emission_mat.shape[1]
+        # Weight of each MIDI note mod 12 in a packed event (see pack_events)
+        self.weights = 1 << np.arange(self.n_features)
+        # Total number of (non-empty) events seen and committed 
+        self.n_events = 0
+        self.n_committed = 0
+        self.reset()
+
+    def reset(self):
+        ''' Reset Method
+                Starts a new piece, discarding the notes present, the pending 
+                event and the Viterbi scores (labels that are not committed are
+                lost; see the flush method) 
+        '''
+        self.notes = np.zeros(self.n_features,dtype=int)
+        self.time = None
+        self.scores = None
+        # backpointers[ii] maps the states of the (ii+1)-th uncommitted event 
+        # to the most probable states of the ii-th uncommitted event, so there
+        # is one backpointer less than there are uncommitted events (and none
+        # when every event is committed) 
+        self.backpointers = []
+
+    def push(self,time,note,velocity):
+        ''' Push Method
+                Adds a single note on (velocity greater than 0) or note off 
+                (velocity 0) event. The notes played at the same time form one
+                event, which is decoded once a note at a later time arrives; a
+                time less than the previous time begins a new piece 
+                
+                Args:
+                    time: Integer indicating the MIDI time of the note 
+                    note: Integer indicating the MIDI note number 
+                    velocity: Integer indicating the MIDI velocity of the note
+                Returns:
+                    committed: List of (event index, label) tuples of the 
+                               events whose labels were committed 
+        '''
+        committed = []
+        if self.time is not None and time != self.time:
+            if time < self.time:
+                committed = self.flush()
+            else:
+                committed = self.end_event()
+        self.time = time
+        self.notes[note%12] += 1 if velocity > 0 else -1
+        return committed
+
+    def end_event(self):
+        ''' End_event Method
+                Decodes the event formed by the notes currently present (events
+                without any notes present are skipped, as in build_event_list)
+                
+                Returns:
+                    committed: List of (event index, label) tuples of the 
+                               events whose labels were committed 
+        '''
+        if not np.any(self.notes != 0):
+            return []
+        code = int(self.weights @ (self.notes > 0))
+        log_emit = self.decoder.log_emission_table[code]
+        if self.scores is None:
+            self.scores = self.decoder.log_start + log_emit
+        else:
+            candidates = self.scores[:,np.newaxis] + self.decoder.log_trans
+            backpointers = np.argmax(candidates,axis=0)
+            self.scores = candidates[backpointers,self.states] + log_emit
+            # The backpointers into an event whose label is already committed 
+            # are never followed 
+            if self.n_events > self.n_committed:
+                self.backpointers.append(backpointers.astype(self.decoder.backpointer_dtype))
+        self.n_events += 1
+        return self.commit()
+
+    def commit(self,n_commit=None):
+        ''' Commit Method
+                Commits the labels of the oldest uncommitted events that every 
+                surviving path agrees on, and of any events more than lag 
+                events old 
+                
+                Args:
+                    n_commit: Integer indicating the number of uncommitted events
+                              to commit regardless (defaults to none)
+                Returns:
+                    committed: List of (event index, label) tuples of the 
+                               events whose labels were committed 
+        '''
+        n_uncommitted = self.n_events - self.n_committed
+        n_commit = n_commit or 0
+        if self.lag is not None:
+            n_commit = max(n_commit,n_uncommitted - self.lag)
+        # Follow the backpointers of every current state; once all of them 
+        # lead to the same state, all the older events agree as well 
+        ancestors = self.states
+        for ii in range(len(self.backpointers)-1,n_commit-1,-1):
+            ancestors = self.backpointers[ii][ancestors]
+            if np.all(ancestors == ancestors[0]):
+                n_commit = ii + 1
+                break
+        if n_commit == 0:
+            return []
+        # Follow the most probable path back to the oldest uncommitted event 
+        path = np.zeros(n_uncommitted,dtype=int)
+        path[-1] = np.argmax(self.scores)
+        for ii in range(n_uncommitted-1,0,-1):
+            path[ii-1] = self.backpointers[ii-1][path[ii]]
+        committed = [(self.n_committed+ii,int(path[ii])) for ii in range(n_commit)]
+        del self.backpointers[:n_commit]
+        self.n_committed += n_commit
+        return committed
+
+    def flush(self):
+        ''' Flush Method
+                Ends the current piece: decodes the pending event, commits the 
+                labels of all the remaining events along the most probable path
+                and starts a new piece 
+                
+                Returns:
+                    committed: List of (event index, label) tuples of the 
+                               events whose labels were committed 
+        '''
+        committed = self.end_event() if self.time is not None else []
+        committed += self.commit(self.n_events - self.n_committed)
+        self.reset()
+        return committed
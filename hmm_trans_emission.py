@@ -1,298 +1,1220 @@
 '''
 Usage:
-python hmm_trans_emission.py 
+python hmm_trans_emission.py [folder of .csv or .mid files, default JSB_Chorales]
+python hmm_trans_emission.py --update [folder of new .csv or .mid files]
 '''
 # Program to generate transition and emission probabilitiy matrices 
+# (can also be imported, Ex: model,df_y,event_codes,lengths_list = train())
 
 import numpy as np
-import pandas
 import glob
-import random
-import csv
-
-def update_event_list(df,event_list,event_num,ii):
-    ''' Update_event_list Method
-            Updates the input event_list, adding 1 to the corresponding 
-            MIDI note mod 12 if it is present in the current event, and
-            subtracting 1 from the corresponding MIDI note mod 12 if it
-            is absent from the current event. 
+import os
+import multiprocessing
+import argparse
+import json
+import struct
+import hashlib
+import importlib
+from midi_reader import read_midi
+
+eps = np.finfo(float).eps
+# Column names of the CSV files converted from MIDI using midicsv 
+MIDI_CSV_NAMES = ['Track','Time','Action','Channel','Note','Velocity']
+# Default folder of MIDI information and harmonic labels file of the dataset 
+CORPUS_PATH = 'JSB_Chorales'
+LABELS_FILE = 'jsbach_chorals_harmony.csv'
+# Default folder of parsed pieces and harmonic labels cached by the command line
+# interface. Increase PARSER_VERSION whenever a change to the parsing code 
+# changes its results, so that stale cache files are no longer used 
+CACHE_DIR = '.chorale_cache'
+PARSER_VERSION = 2
+# Extensions of Standard MIDI Files, which are read directly by midi_reader 
+MIDI_EXTENSIONS = ('.mid','.midi')
+# Smallest number of pieces loaded by a pool of worker processes by default: 
+# parsing a piece takes a few milliseconds, so for fewer pieces starting the 
+# workers costs more than it saves 
+PARALLEL_MIN_PIECES = 200
+# File written by this program for use by other programs, and the magic string,
+# version and array alignment of its binary format 
+MODEL_BUNDLE = 'hmm_model.bin'
+MODEL_BUNDLE_MAGIC = b'HMMMODEL'
+MODEL_BUNDLE_VERSION = 2
+MODEL_BUNDLE_ALIGN = 64
+# Number of distinct observations: every event is a set of the 12 MIDI notes 
+# mod 12, stored as a 12-bit integer (see pack_events)
+N_OBSERVATIONS = 2**12
+
+def build_event_list(times,notes,velocities):
+    ''' Build_event_list Method
+            Converts whole columns of MIDI information into the event_list 
+            array in a single vectorized pass (instead of walking the MIDI
+            information row by row). 
+            An event begins whenever the time of a row differs from the time
+            of the previous row, and a new piece begins whenever the time of 
+            a row is less than the time of the previous row. 
             A MIDI note is present if its velocity is greater than 0.0
             and a MIDI note is absent if its velocity is 0.0
             
             Args:
-                df: Pandas DataFrame of MIDI information 
-                    Columns: Features; Ex: 'Velocity'
-                    Rows: Examples 
+                times: 1-D Array of MIDI times as ints (sorted within each 
+                       piece, with the pieces in the dataset concatenated)
+                       Shape: [n_rows]
+                notes: 1-D Array of MIDI note numbers as ints 
+                       Shape: [n_rows]
+                velocities: 1-D Array of MIDI velocities 
+                            Shape: [n_rows]
+            Returns:
                 event_list: 2-D Array of event information (i.e. 12 features
                             each corresponding to the MIDI notes mod 12, with
                             1 indicating note is present and 0 indicating note
                             is absent)
-                            Shape: [n_features=12,n_examples)
-                event_num: Integer indicating the number of the current event
-                ii: Integer indicating the current row under analysis in the
-                    Pandas DataFrame
+                            Shape: [n_features=12,n_examples]
+                lengths_list: 1-D Array of indexes for the dataset as ints
+                              (i.e. indicates the indexes into the event_list
+                              array where each piece after the first begins)
+                              Shape: [n_pieces-1]
+        '''
+    times = np.asarray(times)
+    notes = np.asarray(notes).astype(int)
+    velocities = np.asarray(velocities)
+    if len(times) == 0:
+        return np.zeros((12,0)),np.array([],dtype=int)
+    time_diff = np.diff(times)
+    # A row starts a new piece if its time is less than the time of the 
+    # previous row, and starts a new event if its time differs from the time
+    # of the previous row 
+    new_piece = np.concatenate(([True],time_diff < 0))
+    new_event = np.concatenate(([True],time_diff != 0))
+    piece_id = np.cumsum(new_piece) - 1
+    event_id = np.cumsum(new_event) - 1
+    n_events = event_id[-1] + 1
+    # Add 1 to the corresponding MIDI note mod 12 for every note that is 
+    # played and subtract 1 for every note that is released, grouping all 
+    # rows that occur at the same time into the same event 
+    changes = np.zeros((n_events,12))
+    np.add.at(changes,(event_id,notes%12),np.where(velocities > 0,1,-1))
+    # The notes present during an event are the cumulative sum of all the 
+    # changes since the beginning of the piece, so subtract the cumulative 
+    # sum at the end of the previous piece 
+    event_list = np.cumsum(changes,axis=0)
+    event_piece = piece_id[new_event]
+    piece_first_event = np.flatnonzero(np.concatenate(([True],np.diff(event_piece) != 0)))
+    offsets = np.zeros((len(piece_first_event),12))
+    offsets[1:] = event_list[piece_first_event[1:]-1]
+    event_list -= offsets[event_piece]
+    # Remove all events with all zeros 
+    nonzero = ~np.all(event_list==0,axis=1)
+    event_list = event_list[nonzero]
+    event_piece = event_piece[nonzero]
+    # Find the indexes in event_list where each new piece begins 
+    lengths_list = np.flatnonzero(np.diff(event_piece) != 0) + 1
+    # Convert event_list to 1 (indicating presence of note) and 0 (indicating 
+    # absence of note)
+    event_list = np.minimum(event_list,1)
+    return event_list.T,lengths_list
+
+def pack_events(event_list):
+    ''' Pack_events Method
+            Packs the 0/1 features of each event into the bits of a single 
+            integer (bit jj is set if MIDI note mod 12 jj is present), so that 
+            an event takes 2 bytes instead of 12 floats and can be used directly 
+            as an index into tables with one row per possible observation 
+            
+            Args:
+                event_list: 2-D Array of event information 
+                            Shape: [n_features=12,n_examples]
+            Returns:
+                event_codes: 1-D Array of packed events as uint16 
+                             Shape: [n_examples]
+        '''
+    event_list = np.asarray(event_list)
+    if event_list.shape[0] > 16:
+        raise ValueError('Cannot pack more than 16 features into uint16 codes')
+    weights = (1 << np.arange(event_list.shape[0])).astype(np.uint16)
+    return (weights @ (event_list > 0)).astype(np.uint16)
+
+def unpack_events(event_codes,n_features=12):
+    ''' Unpack_events Method
+            Inverse of pack_events 
+            
+            Args:
+                event_codes: 1-D Array of packed events 
+                             Shape: [n_examples]
+                n_features: Integer indicating the number of features per event
+            Returns:
+                event_list: 2-D Array of event information as 0/1 floats 
+                            Shape: [n_features=12,n_examples]
+        '''
+    event_codes = np.asarray(event_codes,dtype=np.int64)
+    return ((event_codes >> np.arange(n_features)[:,np.newaxis]) & 1).astype(float)
+
+def observation_bits(n_features=12):
+    ''' Observation_bits Method
+            Lists the features of every possible packed event 
+            
+            Args:
+                n_features: Integer indicating the number of features per event
+            Returns:
+                bits: 2-D Array where bits[code] are the 0/1 features of the 
+                      packed event code (the rows of unpack_events) 
+                      Shape: [2**n_features,n_features]
+        '''
+    return unpack_events(np.arange(2**n_features),n_features).T
+
+OBSERVATION_BITS = observation_bits()
+
+def read_chorale_notes(filename):
+    ''' Read_chorale_notes Method
+            Reads the MIDI information of a single piece in the dataset, either
+            from a CSV file (converted from MIDI using midicsv) or directly from
+            a .mid file, and keeps only the note on/off rows, sorted by time 
+            
+            Args:
+                filename: String indicating the path to the CSV or .mid file 
+            Returns:
+                times: 1-D Array of MIDI times as ints 
+                       Shape: [n_rows]
+                notes: 1-D Array of MIDI note numbers as ints 
+                       Shape: [n_rows]
+                velocities: 1-D Array of MIDI velocities 
+                            Shape: [n_rows]
+        '''
+    if filename.lower().endswith(MIDI_EXTENSIONS):
+        return read_midi(filename)
+    import pandas
+    df_temp = pandas.read_csv(filename,names=MIDI_CSV_NAMES,usecols=[1,2,4,5],
+                              skipinitialspace=True)
+    # Ignore meta events, control changes, etc. and keep only the rows that 
+    # play or release a note 
+    df_temp = df_temp[df_temp['Action'].isin(['Note_on_c','Note_off_c'])]
+    times = df_temp['Time'].values.astype(int)
+    order = np.argsort(times,kind='stable')
+    return (times[order],df_temp['Note'].values.astype(int)[order],
+            df_temp['Velocity'].values[order])
+
+def parse_chorale(filename):
+    ''' Parse_chorale Method
+            Converts the note on/off rows of a single piece in the dataset (see
+            read_chorale_notes) into the packed events of that piece (see 
+            pack_events), which take 2 bytes per event instead of the 96 bytes
+            of a column of event_list 
+            
+            Args:
+                filename: String indicating the path to the CSV or .mid file 
+            Returns:
+                event_codes: 1-D Array of packed events for the piece as uint16
+                             Shape: [n_examples]
+        '''
+    event_list,_ = build_event_list(*read_chorale_notes(filename))
+    return pack_events(event_list)
+
+def content_digest(filename):
+    ''' Content_digest Method
+            Computes the SHA-256 hash of the contents of a file, read one block
+            at a time 
+            
+            Args:
+                filename: String indicating the path to the file 
             Returns:
-                event_list: 2-D Array of event information (updated)
+                digest: Hash as 32 bytes 
         '''
-    if df.iloc[ii,5] > 0.0:
-        event_list[event_num,df.iloc[ii,4]%12] += 1
+    digest = hashlib.sha256()
+    with open(filename,'rb') as input_file:
+        for block in iter(lambda: input_file.read(1<<20),b''):
+            digest.update(block)
+    return digest.digest()
+
+def file_hash(filename,extra='',digest=None):
+    ''' File_hash Method
+            Computes the key used to cache the parsed contents of a file: the 
+            SHA-256 hash of the parser version, any extra information the 
+            parsed contents depend on, and the hash of the contents of the 
+            file (see content_digest) 
+            
+            Args:
+                filename: String indicating the path to the file 
+                extra: String of extra information to include in the key 
+                digest: Hash of the contents of the file as bytes, if already 
+                        computed 
+            Returns:
+                key: Hexadecimal hash as a string 
+        '''
+    if digest is None:
+        digest = content_digest(filename)
+    key = hashlib.sha256(('v'+str(PARSER_VERSION)+extra).encode('utf-8'))
+    key.update(bytes(digest))
+    return key.hexdigest()
+
+def piece_hashes(filenames):
+    ''' Piece_hashes Method
+            Computes the hash of the contents of every piece (see 
+            content_digest), stored in the model bundle so that a piece is 
+            never counted twice (see update_model) and reused as the cache keys
+            of the parsed pieces 
+            
+            Args:
+                filenames: 1-D Array of paths to the .csv or .mid files of the 
+                           pieces as strings 
+            Returns:
+                hashes: 2-D Array of the hashes as uint8 
+                        Shape: [n_pieces,32]
+        '''
+    hashes = np.zeros((len(filenames),32),dtype=np.uint8)
+    for ii,filename in enumerate(filenames):
+        hashes[ii] = np.frombuffer(content_digest(filename),dtype=np.uint8)
+    return hashes
+
+def cache_save(path,save,*args,**kwargs):
+    ''' Cache_save Method
+            Writes a cache file through a temporary file, so that a concurrent 
+            reader (or an interrupted run) never sees a partially-written file 
+            
+            Args:
+                path: String indicating the path to the cache file 
+                save: Function writing the arrays to an open file; Ex: np.save
+                args: Arrays passed to the save function 
+                kwargs: Named arrays passed to the save function 
+        '''
+    os.makedirs(os.path.dirname(path) or '.',exist_ok=True)
+    temp = path+'.'+str(os.getpid())+'.tmp'
+    with open(temp,'wb') as cache_file:
+        save(cache_file,*args,**kwargs)
+    os.replace(temp,path)
+
+def load_chorale(filename,cache_dir=None,digest=None):
+    ''' Load_chorale Method
+            Returns the packed events of a single piece (see parse_chorale),
+            reusing the cached result if the contents of the file have not 
+            changed since it was last parsed 
+            
+            Args:
+                filename: String indicating the path to the CSV or .mid file 
+                cache_dir: String indicating the path to the cache folder, or 
+                           None to always parse the file 
+                digest: Hash of the contents of the file as bytes, if already 
+                        computed (see content_digest) 
+            Returns:
+                event_codes: 1-D Array of packed events for the piece as uint16
+                             Shape: [n_examples]
+        '''
+    if cache_dir is None:
+        return parse_chorale(filename)
+    path = os.path.join(cache_dir,'events-'+file_hash(filename,digest=digest)+'.npy')
+    if os.path.exists(path):
+        return np.load(path)
+    event_codes = parse_chorale(filename)
+    cache_save(path,np.save,event_codes)
+    return event_codes
+
+def load_chorales(filenames,processes=None,cache_dir=None,hashes=None):
+    ''' Load_chorales Method
+            Converts the CSV files of every piece in the dataset into events 
+            using a pool of worker processes (one piece per task) and 
+            concatenates the results once at the end 
+            
+            Args:
+                filenames: 1-D Array of paths to the CSV files as strings 
+                           Shape: [n_pieces]
+                processes: Integer indicating the number of worker processes 
+                           (defaults to the number of CPUs). If 1, the pieces 
+                           are converted in the current process, as they are 
+                           by default with a single CPU or fewer than 
+                           PARALLEL_MIN_PIECES pieces. 
+                cache_dir: String indicating the path to the cache folder of 
+                           parsed pieces, or None to parse every piece 
+                hashes: 2-D Array of the hashes of the pieces as uint8, if 
+                        already computed (see piece_hashes) 
+                        Shape: [n_pieces,32]
+            Returns:
+                event_codes: 1-D Array of packed events for all the pieces as 
+                             uint16 (see pack_events)
+                             Shape: [n_examples]
+                lengths_list: 1-D Array of indexes into the event_codes array 
+                              where each piece after the first begins 
+                              Shape: [n_pieces-1]
+        '''
+    filenames = list(filenames)
+    if hashes is None:
+        tasks = [(filename,cache_dir) for filename in filenames]
+    else:
+        tasks = [(filename,cache_dir,bytes(row)) for filename,row in zip(filenames,hashes)]
+    if processes is None and ((os.cpu_count() or 1) == 1 or 
+                              len(filenames) < PARALLEL_MIN_PIECES):
+        processes = 1
+    if processes == 1 or len(filenames) <= 1:
+        pieces = [load_chorale(*task) for task in tasks]
     else:
-        event_list[event_num,df.iloc[ii,4]%12] -= 1
-    return event_list
+        # Import pandas once before the workers are started (and forked), 
+        # rather than once in every worker 
+        if not all(filename.lower().endswith(MIDI_EXTENSIONS) for filename in filenames):
+            importlib.import_module('pandas')
+        with multiprocessing.Pool(processes) as pool:
+            chunksize = max(1,len(filenames)//(4*(processes or os.cpu_count() or 1)))
+            pieces = pool.starmap(load_chorale,tasks,chunksize=chunksize)
+    if len(pieces) == 0:
+        return np.zeros(0,dtype=np.uint16),np.array([],dtype=int)
+    # The offset of each piece in event_codes is the total number of events in
+    # all the pieces before it 
+    lengths = np.array([len(piece) for piece in pieces])
+    lengths_list = np.cumsum(lengths)[:-1]
+    event_codes = np.concatenate(pieces)
+    return event_codes,lengths_list
+
+def normalize_counts(counts,totals):
+    ''' Normalize_counts Method
+            Divides every row of a count matrix by the corresponding total and 
+            replaces values of 0 by eps to ensure that the probability of an
+            event with zero frequency does not become 0 (instead, it becomes 
+            very low through multiplication by eps). Rows with a total of 0
+            are converted entirely to eps. 
+            
+            Args:
+                counts: 2-D Array of counts as floats 
+                        Shape: [n_states,n_columns]
+                totals: 1-D Array of totals as floats to divide each row by 
+                        Shape: [n_states]
+            Returns:
+                probs: 2-D Array of probabilities as floats 
+                       Shape: [n_states,n_columns]
+        '''
+    totals = np.asarray(totals,dtype=float)[:,np.newaxis]
+    probs = np.zeros(counts.shape)
+    np.divide(counts,totals,out=probs,where=totals > 0)
+    probs[probs == 0] = eps
+    return np.ascontiguousarray(probs)
+
+class hmm_model:
+    ''' Hmm_model Class
+            Stores the transition and emission counts of the dataset as dense 
+            numpy arrays, together with the corresponding transition and 
+            emission probability matrices 
+            
+            Args:
+                n_states: Integer indicating the number of harmonic labels 
+                          (states); Ex: 144
+                n_features: Integer indicating the number of features in each 
+                            observation; Ex: 12 (the 12 MIDI notes mod 12)
+    '''
+    def __init__(self,n_states=144,n_features=12):
+        self.n_states = n_states
+        self.n_features = n_features
+        # trans_counts[ii,jj] is the number of times state ii was followed by 
+        # state jj 
+        self.trans_counts = np.zeros((n_states,n_states))
+        # emission_counts[ii,jj] is the number of events with state ii in 
+        # which MIDI note mod 12 jj was present 
+        self.emission_counts = np.zeros((n_states,n_features))
+        # state_counts[ii] is the number of events with state ii 
+        self.state_counts = np.zeros(n_states)
+        # The probability matrices are only generated from the counts when 
+        # they are requested (see the trans_mat and emission_mat properties)
+        self._trans_mat = None
+        self._emission_mat = None
+
+    @property
+    def trans_mat(self):
+        ''' 2-D Array of transition probabilities, normalized from the counts 
+            on demand. Shape: [n_states,n_states] 
+        '''
+        if self._trans_mat is None:
+            self.normalize()
+        return self._trans_mat
+
+    @property
+    def emission_mat(self):
+        ''' 2-D Array of emission probabilities, normalized from the counts 
+            on demand. Shape: [n_states,n_features] 
+        '''
+        if self._emission_mat is None:
+            self.normalize()
+        return self._emission_mat
+
+    @property
+    def trans_sparse(self):
+        ''' Sparse_matrix view of trans_mat, storing only the observed 
+            transitions (see sparse_from_dense) 
+        '''
+        return sparse_from_dense(self.trans_mat)
+
+    def count_transitions(self,df_y,lengths_list):
+        ''' Count_transitions Method
+                Counts the transitions between the states of a sequence of pieces
+                (see the count method for the Args) 
+                
+                Returns:
+                    trans_counts: 2-D Array of transition counts 
+                                  Shape: [n_states,n_states]
+        '''
+        df_y = np.asarray(df_y).reshape(-1).astype(int)
+        # Since the event_list traverses through all the pieces in the dataset 
+        # sequentially, ignore harmonic transitions from the end of one piece to 
+        # the beginning of the next (as these are arbitrary). These transitions 
+        # are indicated by the indexes in lengths_list 
+        valid = np.ones(len(df_y),dtype=bool)
+        valid[:1] = False
+        valid[np.asarray(lengths_list,dtype=int)] = False
+        # Count every (initial state, final state) pair in one pass by 
+        # converting each pair into a single flat index 
+        flat = df_y[:-1][valid[1:]]*self.n_states + df_y[1:][valid[1:]]
+        return np.bincount(flat,minlength=self.n_states**2).reshape(
+               self.n_states,self.n_states).astype(float)
+
+    def count_emissions(self,df_y,event_list):
+        ''' Count_emissions Method
+                Counts the notes present in the events of each state and the 
+                number of events of each state (see the count method for the 
+                Args) 
+                
+                Returns:
+                    emission_counts: 2-D Array of emission counts 
+                                     Shape: [n_states,n_features]
+                    state_counts: 1-D Array of state counts 
+                                  Shape: [n_states]
+        '''
+        df_y = np.asarray(df_y).reshape(-1).astype(int)
+        event_codes = np.asarray(event_list)
+        if event_codes.ndim == 2:
+            event_codes = pack_events(event_codes)
+        # Count every (state, packed event) pair in one pass, then add up the
+        # features of every packed event for each state 
+        n_codes = 2**self.n_features
+        flat = df_y*n_codes + event_codes
+        histogram = np.bincount(flat,minlength=self.n_states*n_codes).reshape(
+                    self.n_states,n_codes).astype(float)
+        bits = OBSERVATION_BITS if self.n_features == 12 else observation_bits(self.n_features)
+        emission_counts = histogram @ bits
+        state_counts = np.bincount(df_y,minlength=self.n_states).astype(float)
+        return emission_counts,state_counts
+
+    def count(self,df_y,event_list,lengths_list):
+        ''' Count Method
+                Counts the transitions and emissions in a sequence of pieces 
+                
+                Args:
+                    df_y: 2-D Numpy Array of harmonic labels for each event 
+                          Shape: [1,n_examples]
+                    event_list: 2-D Array of event information (i.e. 12 features
+                                each corresponding to the MIDI notes mod 12, with
+                                1 indicating note is present and 0 indicating note
+                                is absent)
+                                Shape: [n_features=12,n_examples]
+                                (or the 1-D Array of packed events returned by
+                                pack_events)
+                    lengths_list: 1-D Array of indexes into the event_list array 
+                                  where each piece after the first begins 
+                                  Shape: [n_pieces-1]
+                Returns:
+                    trans_counts: 2-D Array of transition counts 
+                                  Shape: [n_states,n_states]
+                    emission_counts: 2-D Array of emission counts 
+                                     Shape: [n_states,n_features]
+                    state_counts: 1-D Array of state counts 
+                                  Shape: [n_states]
+        '''
+        trans_counts = self.count_transitions(df_y,lengths_list)
+        emission_counts,state_counts = self.count_emissions(df_y,event_list)
+        return trans_counts,emission_counts,state_counts
+
+    def fit(self,df_y,event_list,lengths_list):
+        ''' Fit Method
+                Replaces the stored counts with the transitions and emissions 
+                counted in the dataset (see the count method for the Args) 
+                
+                Returns:
+                    self: The fitted hmm_model 
+        '''
+        self.trans_counts,self.emission_counts,self.state_counts = self.count(
+            df_y,event_list,lengths_list)
+        self._trans_mat = None
+        self._emission_mat = None
+        return self
+
+    def update(self,pieces,sign=1):
+        ''' Update Method
+                Folds the transitions and emissions of new pieces into the 
+                stored counts, without re-processing the pieces already counted.
+                The probability matrices are re-normalized the next time they 
+                are requested. 
+                
+                Args:
+                    pieces: List of (df_y, event_list) tuples, one per piece,
+                            where df_y is the 1-D Array of harmonic labels of 
+                            the piece and event_list is the 2-D Array of event 
+                            information (or the 1-D Array of packed events) of 
+                            the piece 
+                    sign: 1 to add the counts of the pieces, or -1 to subtract 
+                          them (see the remove method)
+                Returns:
+                    self: The updated hmm_model 
+        '''
+        pieces = list(pieces)
+        if len(pieces) == 0:
+            return self
+        df_y = np.concatenate([np.asarray(piece[0]).reshape(-1) for piece in pieces])
+        event_list = np.concatenate([np.asarray(piece[1]) for piece in pieces],axis=-1)
+        lengths_list = np.cumsum([np.asarray(piece[0]).size for piece in pieces])[:-1]
+        trans_counts,emission_counts,state_counts = self.count(df_y,event_list,
+                                                               lengths_list)
+        self.trans_counts = self.trans_counts + sign*trans_counts
+        self.emission_counts = self.emission_counts + sign*emission_counts
+        self.state_counts = self.state_counts + sign*state_counts
+        self._trans_mat = None
+        self._emission_mat = None
+        return self
+
+    def remove(self,pieces):
+        ''' Remove Method
+                Subtracts the transitions and emissions of pieces that were 
+                previously counted (see the update method for the Args) 
+                
+                Returns:
+                    self: The updated hmm_model 
+        '''
+        return self.update(pieces,sign=-1)
+
+    def normalize(self):
+        ''' Normalize Method
+                Generates the transition and emission probability matrices from
+                the stored counts. Each row of the transition probability matrix
+                sums to 1, while each value in the emission probability matrix is
+                the probability that the corresponding MIDI note mod 12 is 
+                present given the state (i.e. the values in a row are evaluated 
+                independently of each other and do not sum to 1)
+        '''
+        self._trans_mat = normalize_counts(self.trans_counts,
+                                           self.trans_counts.sum(axis=1))
+        self._emission_mat = normalize_counts(self.emission_counts,self.state_counts)
+
+class sparse_matrix:
+    ''' Sparse_matrix Class
+            Compressed sparse row (CSR) view of a probability matrix generated 
+            by normalize_counts, in which most values are the eps floor: only 
+            the values above the floor are stored, and every other value is 
+            implicitly equal to the floor 
+            
+            Args:
+                indptr: 1-D Array of ints, where the stored values of row ii are
+                        data[indptr[ii]:indptr[ii+1]]
+                        Shape: [n_rows+1]
+                indices: 1-D Array of the columns of the stored values as ints
+                         (increasing within each row)
+                         Shape: [n_stored]
+                data: 1-D Array of the stored values 
+                      Shape: [n_stored]
+                shape: Tuple of the number of rows and columns of the matrix 
+                floor: Float value of every value that is not stored 
+    '''
+    def __init__(self,indptr,indices,data,shape,floor=eps):
+        self.indptr = np.asarray(indptr,dtype=np.int64)
+        self.indices = np.asarray(indices,dtype=np.int64)
+        self.data = np.asarray(data,dtype=float)
+        self.shape = tuple(int(n) for n in shape)
+        self.floor = float(floor)
+
+    @property
+    def n_stored(self):
+        ''' Integer indicating the number of stored values '''
+        return len(self.data)
+
+    def row(self,ii):
+        ''' Row Method
+                Returns the stored values of a row 
+                
+                Args:
+                    ii: Integer indicating the row 
+                Returns:
+                    indices: 1-D Array of the columns of the stored values 
+                    data: 1-D Array of the stored values 
+        '''
+        start,end = self.indptr[ii],self.indptr[ii+1]
+        return self.indices[start:end],self.data[start:end]
+
+    def to_dense(self):
+        ''' To_dense Method
+                Returns the matrix as a 2-D Array, with the floor in place of 
+                the values that are not stored 
+        '''
+        matrix = np.full(self.shape,self.floor)
+        rows = np.repeat(np.arange(self.shape[0]),np.diff(self.indptr))
+        matrix[rows,self.indices] = self.data
+        return matrix
+
+    def transpose(self):
+        ''' Transpose Method
+                Returns the sparse_matrix of the transposed matrix (i.e. the 
+                columns of this matrix as rows); Ex: the predecessors of every
+                state of a transition matrix 
+        '''
+        rows = np.repeat(np.arange(self.shape[0]),np.diff(self.indptr))
+        order = np.argsort(self.indices,kind='stable')
+        counts = np.bincount(self.indices,minlength=self.shape[1])
+        indptr = np.concatenate(([0],np.cumsum(counts)))
+        return sparse_matrix(indptr,rows[order],self.data[order],
+                             (self.shape[1],self.shape[0]),self.floor)
 
-def trans_prob(df_y,lengths_list,labels):
-    ''' Trans_prob Method
-            Generates the transition probability matrix 
+def sparse_from_dense(matrix,floor=eps):
+    ''' Sparse_from_dense Method
+            Converts a probability matrix generated by normalize_counts into a 
+            sparse_matrix storing only the values above the floor 
+            
+            Args:
+                matrix: 2-D Array of probabilities 
+                floor: Float value of the entries that are not stored 
+            Returns:
+                sparse: sparse_matrix view of the matrix 
+        '''
+    matrix = np.asarray(matrix,dtype=float)
+    stored = matrix > floor
+    rows,columns = np.nonzero(stored)
+    indptr = np.concatenate(([0],np.cumsum(stored.sum(axis=1))))
+    return sparse_matrix(indptr,columns,matrix[rows,columns],matrix.shape,floor)
+
+def sparse_trans_from_bundle(bundle):
+    ''' Sparse_trans_from_bundle Method
+            Returns the sparse_matrix of the transition probabilities stored in
+            a model bundle (bundles without the sparse arrays are converted 
+            from trans_mat)
+            
+            Args:
+                bundle: Dictionary returned by load_model_bundle 
+            Returns:
+                trans_sparse: sparse_matrix of the transition probabilities 
+        '''
+    if 'trans_indptr' not in bundle:
+        return sparse_from_dense(bundle['trans_mat'])
+    n_states = len(bundle['trans_indptr']) - 1
+    return sparse_matrix(bundle['trans_indptr'],bundle['trans_indices'],
+                         bundle['trans_data'],(n_states,n_states))
+
+def split_pieces(df_y,event_list,lengths_list):
+    ''' Split_pieces Method
+            Splits the df_y and event_list arrays of the dataset into the 
+            (df_y, event_list) tuples of the individual pieces used by the 
+            hmm_model update and remove methods 
             
             Args:
                 df_y: 2-D Numpy Array of harmonic labels for each event 
                       Shape: [1,n_examples]
-                lengths_list: 1-D Array of indexes for the dataset as ints
-                              (i.e. indicates the indexes into the event_list
-                              array of where each piece in the dataset begins 
-                              and ends)
-                              Shape: [n_pieces]
+                event_list: 2-D Array of event information 
+                            Shape: [n_features=12,n_examples]
+                            (or the 1-D Array of packed events returned by 
+                            pack_events)
+                lengths_list: 1-D Array of indexes into the event_list array 
+                              where each piece after the first begins 
+                              Shape: [n_pieces-1]
+            Returns:
+                pieces: List of (df_y, event_list) tuples, one per piece 
+        '''
+    df_y = np.asarray(df_y).reshape(-1)
+    lengths_list = np.asarray(lengths_list,dtype=int)
+    return list(zip(np.split(df_y,lengths_list),
+                    np.split(np.asarray(event_list),lengths_list,axis=-1)))
+
+def save_model_bundle(filename,roots,labels,arrays):
+    ''' Save_model_bundle Method
+            Writes the vocabularies and arrays generated by this program into a
+            single versioned binary file for use by other programs. The file 
+            consists of a magic string, the format version and the length of a 
+            JSON header (holding the roots and labels dictionaries and the dtype,
+            shape and byte offset of every array), followed by the raw array 
+            data, with each array aligned to 64 bytes so that it can be 
+            memory-mapped directly 
+            
+            Args:
+                filename: String indicating the path of the file to write 
+                roots: Dictionary of roots and corresponding MIDI numbers mod 12
+                       Keys: Roots as strings; Ex: 'C_'
+                       Values: MIDI number mod 12 of root 
                 labels: Dictionary of harmonies and corresponding integer labels
                         Keys: Harmonies as strings, Ex: 'C_M'
                         Values: Corresponding (arbitrary) integer label
                         ranging from 0 to 143
+                arrays: Dictionary of arrays to store 
+                        Keys: Names of the arrays as strings; Ex: 'trans_mat'
+                        Values: Numpy arrays 
+        '''
+    arrays = {name:np.ascontiguousarray(array) for name,array in arrays.items()}
+    header = {'version':MODEL_BUNDLE_VERSION,
+              'roots':{key:int(value) for key,value in roots.items()},
+              'labels':{key:int(value) for key,value in labels.items()},
+              'arrays':{}}
+    # Compute the byte offset of each array relative to the start of the data
+    # section 
+    offset = 0
+    for name,array in arrays.items():
+        offset = -(-offset//MODEL_BUNDLE_ALIGN)*MODEL_BUNDLE_ALIGN
+        header['arrays'][name] = {'dtype':array.dtype.str,'shape':list(array.shape),
+                                  'offset':offset}
+        offset += array.nbytes
+    header_bytes = json.dumps(header).encode('utf-8')
+    prefix_len = len(MODEL_BUNDLE_MAGIC) + 8 + len(header_bytes)
+    data_start = -(-prefix_len//MODEL_BUNDLE_ALIGN)*MODEL_BUNDLE_ALIGN
+    # Pad the header so that the data section begins on an aligned offset 
+    header_bytes += b' '*(data_start - prefix_len)
+    # Write to a temporary file first and then replace the existing file, so 
+    # that processes which have memory-mapped the existing file are unaffected
+    with open(filename+'.tmp','wb') as binfile:
+        binfile.write(MODEL_BUNDLE_MAGIC)
+        binfile.write(struct.pack('<II',MODEL_BUNDLE_VERSION,len(header_bytes)))
+        binfile.write(header_bytes)
+        for name,array in arrays.items():
+            binfile.seek(data_start + header['arrays'][name]['offset'])
+            binfile.write(array.tobytes())
+    os.replace(filename+'.tmp',filename)
+
+def load_model_bundle(filename):
+    ''' Load_model_bundle Method
+            Reads a file written by save_model_bundle. Only the JSON header is 
+            parsed; every array is returned as a read-only numpy memmap, so 
+            loading is near-instant and several processes loading the same file
+            share the same pages in memory 
+            
+            Args:
+                filename: String indicating the path of the file to read 
             Returns:
-                trans_mat: Transition probability matrix dictionary
-                           Keys: Initial States
-                           Values: Dictionaries
-                                   Keys: Final States
-                                   Values: Probability of transitioning from the
-                                   initial states to final states 
-        '''
-    df_y = np.squeeze(df_y)
-    trans_mat = {}
-    # Initialize trans_mat dictionary with zeros 
-    for ii in labels.values():
-        trans_mat[ii] = {}
-        for jj in labels.values():
-            trans_mat[ii][jj] = 0
-    # Since the event_list traverses through all the pieces in the dataset 
-    # sequentially, ignore harmonic transitions from the end of one piece to the
-    # beginning of the next (as these are arbitrary). These transitions are 
-    # indicated by the indexes in lengths_list 
-    for ii in range(1,len(df_y)):
-        if ii in lengths_list:
-            pass
-        # Add 1 if a transition from one harmony to another occurs 
+                bundle: Dictionary with the keys 'version', 'roots' and 'labels' 
+                        (see save_model_bundle) and one key for every stored 
+                        array; Ex: bundle['trans_mat'] 
+        '''
+    with open(filename,'rb') as binfile:
+        magic = binfile.read(len(MODEL_BUNDLE_MAGIC))
+        if magic != MODEL_BUNDLE_MAGIC:
+            raise ValueError(filename+' is not a model bundle')
+        version,header_len = struct.unpack('<II',binfile.read(8))
+        if version not in (1,MODEL_BUNDLE_VERSION):
+            raise ValueError('Unsupported model bundle version: '+str(version))
+        header = json.loads(binfile.read(header_len).decode('utf-8'))
+    data_start = len(MODEL_BUNDLE_MAGIC) + 8 + header_len
+    bundle = {'version':version,'roots':header['roots'],'labels':header['labels']}
+    for name,info in header['arrays'].items():
+        shape = tuple(info['shape'])
+        dtype = np.dtype(info['dtype'])
+        # np.memmap cannot map zero bytes 
+        if int(np.prod(shape)) == 0:
+            bundle[name] = np.zeros(shape,dtype=dtype)
         else:
-            trans_mat[df_y[ii-1]][df_y[ii]] += 1
-    for ii in trans_mat.keys():
-        values_sum = sum(trans_mat[ii].values())
-        # If the sum of all values for a label is 0, convert zeros to eps 
-        # This ensures, when using the viterbi algorithm, that the probability
-        # of an event with zero frequency does not become 0 (instead, it becomes
-        # very low through multiplication by eps) 
-        for jj in trans_mat[ii].keys():
-            if values_sum == 0:
-                trans_mat[ii][jj] = eps
-            # Otherwise, divide each value for a label by the sum of all values 
-            # corresponding to the label so that all probabilities sum to 1 
-            else:
-                trans_mat[ii][jj] = trans_mat[ii][jj]/values_sum
-                if trans_mat[ii][jj] == 0:
-                    trans_mat[ii][jj] = eps
-    return trans_mat
-
-def emission_prob(df_y,event_list,labels):
-    ''' Emission_prob Method
-            Generates the emission probability matrix 
+            bundle[name] = np.memmap(filename,dtype=dtype,mode='r',
+                                     offset=data_start+info['offset'],shape=shape)
+    # Version 1 bundles store the unpacked event_list instead of event_codes
+    if 'event_codes' not in bundle and 'event_list' in bundle:
+        bundle['event_codes'] = pack_events(bundle['event_list'])
+    return bundle
+
+def model_from_bundle(bundle):
+    ''' Model_from_bundle Method
+            Restores the hmm_model, with its counts, from a model bundle read by
+            load_model_bundle, so that new pieces can be folded into it 
             
             Args:
-                df_y: 2-D Numpy Array of harmonic labels for each event 
-                      Shape: [1,n_examples]
-                event_list: 2-D Array of event information (i.e. 12 features
-                            each corresponding to the MIDI notes mod 12, with
-                            1 indicating note is present and 0 indicating note
-                            is absent)
-                            Shape: [n_features=12,n_examples)
+                bundle: Dictionary returned by load_model_bundle 
+            Returns:
+                model: hmm_model with the stored counts 
+        '''
+    if 'trans_counts' not in bundle:
+        raise ValueError('The model bundle does not hold the transition and '
+                         'emission counts; retrain without --update')
+    n_states,n_features = bundle['emission_counts'].shape
+    model = hmm_model(n_states,n_features)
+    model.trans_counts = np.array(bundle['trans_counts'])
+    model.emission_counts = np.array(bundle['emission_counts'])
+    model.state_counts = np.array(bundle['state_counts'])
+    return model
+
+def build_labels(roots,quality,added_notes):
+    ''' Build_labels Method
+            Using the roots, quality, and added_notes dictionaries, creates 
+            a dictionary of all the possible labels (called "labels"), where 
+            the keys are the string labels and the values are the corresponding
+            integer labels 
+            Creates another dictionary (called "chords"), where the keys are the 
+            string labels and the values are the MIDI notes mod 12 corresponding 
+            to the string label 
+            
+            Args:
+                roots: Dictionary of roots and corresponding MIDI numbers mod 12
+                quality: Dictionary of qualities and corresponding intervals of 
+                         the third and fifth above the root 
+                added_notes: Dictionary of added notes and corresponding 
+                             intervals above the root (0 for no added note)
+            Returns:
                 labels: Dictionary of harmonies and corresponding integer labels
                         Keys: Harmonies as strings, Ex: 'C_M'
                         Values: Corresponding (arbitrary) integer label
                         ranging from 0 to 143
-            Returns:
-                emission_mat: Emission probability matrix dictionary
-                              Keys: Current States
-                              Values: Dictionaries
-                                    Keys: Observations 
-                                    Values: Probability of observing each observation
-                                    given the current state. Note that each 
-                                    observation's probability, given the current state,
-                                    is evaluated independently of the others (i.e. the 
-                                    sum of all the values does not equal 1)
-        '''
-    df_y = np.squeeze(df_y)
-    # Find all unique harmonic labels and the number of times they occur 
-    unique_labels,counts = np.unique(df_y,return_counts=True)
-    unique_dict = {}
-    # Create a dictionary of unique labels and corresponding counts 
-    for ii,jj in enumerate(unique_labels):
-        unique_dict[jj] = counts[ii] 
-    emission_mat = {}
-    # Initialize trans_mat dictionary with zeros 
-    for ii in labels.values():
-        emission_mat[ii] = {}
-        for jj in np.arange(event_list.shape[0]):
-            emission_mat[ii][jj] = 0
-    # Add data from event_list to the corresponding key and value
-    # Ex: If an event in event_list occurs for state 1, add the data
-    # from event_list to the key corresponding to state 1 
-    for ii in range(len(df_y)):
-        for jj,kk in enumerate(event_list[:,ii]):
-            emission_mat[df_y[ii]][jj] += kk
-    for ii in emission_mat.keys():
-        for jj in emission_mat[ii].keys():
-            # Divide every event's value by the total number of times the state 
-            # occurred to obtain the probability that that event occurs
-            # Ex: If state 1 occurred 3 times, divide every value corresponding
-            # to state 1 by 3. 
-            # In addition, replace values of 0 by eps to ensure that the probability
-            # of an event with zero frequency does not become 0 (instead, it becomes
-            # very low through multiplication by eps) 
-            if ii in unique_dict.keys():
-                emission_mat[ii][jj] = emission_mat[ii][jj]/unique_dict[ii]
-            if emission_mat[ii][jj] == 0:
-                emission_mat[ii][jj] = eps; 
-    return emission_mat
-
-# Read the harmonic labels csv file into a Pandas DataFrame 
-filename = 'jsbach_chorals_harmony.csv'
-df_y = pandas.read_csv(filename,usecols=[16],header=None,skipinitialspace=True)
-# Reduce the number of harmonic labels by using enharmonic spellings
-df_y = df_y.replace(to_replace='C#',value='Db',regex=True)
-df_y = df_y.replace(to_replace='D#',value='Eb',regex=True)
-df_y = df_y.replace(to_replace='F#',value='Gb',regex=True)
-df_y = df_y.replace(to_replace='G#',value='Ab',regex=True)
-df_y = df_y.replace(to_replace='A#',value='Bb',regex=True)
+                chords: Dictionary of harmonies and corresponding MIDI notes 
+                        mod 12 
+                        Keys: Harmonies as strings, Ex: 'C_M'
+                        Values: List of MIDI notes mod 12; Ex: [0,4,7]
+        '''
+    labels = {}
+    chords = {}
+    counter = 0
+    for ii in roots.keys():
+        for jj in quality.keys():
+            for kk in added_notes.keys():
+                labels[ii+jj+kk] = counter
+                counter += 1
+                temp = [roots[ii]]
+                for ll in quality[jj]:
+                    temp.append((roots[ii]+ll)%12)
+                if added_notes[kk] == 0:
+                    pass
+                else:
+                    temp.append((roots[ii]+added_notes[kk])%12)
+                chords[ii+jj+kk] = temp
+    return labels,chords
+
 # Dictionary of string labels and corresponding MIDI notes mod 12 
-roots = {'C_':0,'Db':1,'D_':2,'Eb':3,'E_':4,'F_':5,'Gb':6,          'G_':7,'Ab':8,'A_':9,'Bb':10,'B_':11}
+ROOTS = {'C_':0,'Db':1,'D_':2,'Eb':3,'E_':4,'F_':5,'Gb':6,'G_':7,'Ab':8,'A_':9,
+         'Bb':10,'B_':11}
 # Dictionary of quality labels and corresponding relationship
 # between the root, third, and fifth. Ex: For 'M', [4,7] indicates
 # that the third is 4 MIDI notes above the root and that the 
 # fifth is 7 MIDI notes above the root
-quality = {'M':[4,7],'m':[3,7],'d':[3,6]}
+QUALITY = {'M':[4,7],'m':[3,7],'d':[3,6]}
 # Dictionary of added notes and corresponding relationship between
 # the root and added note. Ex: For '4': 5 indicates that the 
 # added note is 5 MIDI notes above the root
-added_notes = {'4':5,'6':9,'7':10,'':0}
-labels = {}
-chords = {}
-counter = 0
-# Using the roots, quality, and added_notes dictionaries, create 
-# a dictionary of all the possible labels (called "labels"), where 
-# the keys are the string labels and the values are the corresponding
-# integer labels
-# Create another dictionary (called "chords"), where the keys are the 
-# string labels and the values are the MIDI notes mod 12 corresponding 
-# to the string label 
-for ii in roots.keys():
-    for jj in quality.keys():
-        for kk in added_notes.keys():
-            labels[ii+jj+kk] = counter
-            counter += 1
-            temp = [roots[ii]]
-            for ll in quality[jj]:
-                temp.append((roots[ii]+ll)%12)
-            if added_notes[kk] == 0:
-                pass
-            else:
-                temp.append((roots[ii]+added_notes[kk])%12)
-            chords[ii+jj+kk] = temp
-# Convert all the harmonic labels in df_y into the integer labels indicated
-# by the labels dictionary 
-for ii in range(len(df_y)):
-    df_y.iloc[ii,0] = labels[df_y.iloc[ii,0]]
-# Convert df_y into a numpy matrix 
-df_y = df_y.as_matrix().T
-
-# Load in the CSV files with the MIDI information for each piece in the dataset 
-path = 'JSB_Chorales'
-names = ['Track','Time','Action','Channel','Note','Velocity']
-filenames = sorted(glob.glob(path+'/*.csv'))
-all_data = pandas.DataFrame()
-for filename in filenames:
-    df_temp = pandas.read_csv(filename,names=names,skipinitialspace=True)
-    df_temp = df_temp.drop([0,1,2,3,4,5])
-    df_temp = df_temp.reset_index(drop=True)
-    df_temp = df_temp.dropna()
-    df_temp = df_temp.reset_index(drop=True)
-    df_temp = df_temp[~df_temp['Action'].str.contains('Unknown_meta_event')]
-    df_temp = df_temp.reset_index(drop=True)
-    df_temp = df_temp[~df_temp['Action'].str.contains('Control_c')]
-    df_temp = df_temp.reset_index(drop=True)
-    df_temp.iloc[:,0:1] = df_temp.iloc[:,0:1].apply(pandas.to_numeric)
-    df_temp.iloc[:,3:5] = df_temp.iloc[:,3:5].apply(pandas.to_numeric)
-    df_temp = df_temp.sort_values(by=['Time'])
-    df_temp = df_temp.reset_index(drop=True)
-    all_data = all_data.append(df_temp,ignore_index=True)
-
-# Use the time informaton from the all_data Pandas DataFrame to create a numpy
-# array "event_list" which contains the relevant information for each individual
-# event 
-# Also, create an array "lengths_list" which indicates the indexes in event_list
-# corresponding to each piece in the dataset 
-event_list = np.zeros((len(all_data),12))
-event_num = 0
-lengths_list = []
-for ii in range(len(all_data)):
-    # If the time for the current row is the same as that of the previous, 
-    # don't increment to a new event 
-    if ii == 0 or all_data.iloc[ii,1] == all_data.iloc[ii-1,1]:
-        pass
-    # If the time for the current row is less than the time for the previous, this
-    # means a new piece is occuring. Increment event_num by 1 
-    elif all_data.iloc[ii,1] < all_data.iloc[ii-1,1]:
-        lengths_list.append(event_num-1)
-        event_num += 1
-    # If the time for the current row is greater than the time for the previous, this
-    # means a new event is occuring. Increment event_num by 1 and copy the data
-    # from the previous event to update it. 
+ADDED_NOTES = {'4':5,'6':9,'7':10,'':0}
+LABELS,CHORDS = build_labels(ROOTS,QUALITY,ADDED_NOTES)
+# Dictionary of sharp roots and the enharmonic (flat) roots used in their place
+# to reduce the number of harmonic labels 
+ENHARMONIC = {'C#':'Db','D#':'Eb','F#':'Gb','G#':'Ab','A#':'Bb'}
+
+class label_codec:
+    ''' Label_codec Class
+            Converts between harmonic labels as strings and integer labels. All
+            the possible labels are built once from the roots, quality, and 
+            added_notes dictionaries, together with every accepted spelling 
+            (including the sharp spellings, Ex: 'C#M' for 'DbM') and the notes 
+            of every label, so that whole arrays of labels can be encoded or 
+            decoded in a single lookup pass 
+            
+            Args:
+                roots: Dictionary of roots and corresponding MIDI numbers mod 12
+                quality: Dictionary of qualities and corresponding intervals of 
+                         the third and fifth above the root 
+                added_notes: Dictionary of added notes and corresponding 
+                             intervals above the root (0 for no added note)
+    '''
+    def __init__(self,roots=ROOTS,quality=QUALITY,added_notes=ADDED_NOTES):
+        self.labels,self.chords = build_labels(roots,quality,added_notes)
+        self.reverse_labels = {y:x for x,y in self.labels.items()}
+        n_labels = len(self.labels)
+        # Integer label -> string label 
+        self.names = np.array(list(self.labels.keys()))
+        # Integer label -> root (MIDI note mod 12), quality, added note, and 
+        # intervals of the third, fifth and added note above the root 
+        self.root = np.zeros(n_labels,dtype=int)
+        self.quality = np.empty(n_labels,dtype=self.names.dtype)
+        self.added = np.empty(n_labels,dtype=self.names.dtype)
+        self.third = np.zeros(n_labels,dtype=int)
+        self.fifth = np.zeros(n_labels,dtype=int)
+        self.added_interval = np.zeros(n_labels,dtype=int)
+        for ii in roots.keys():
+            for jj in quality.keys():
+                for kk in added_notes.keys():
+                    label = self.labels[ii+jj+kk]
+                    self.root[label] = roots[ii]
+                    self.quality[label] = jj
+                    self.added[label] = kk
+                    self.third[label],self.fifth[label] = quality[jj]
+                    self.added_interval[label] = added_notes[kk]
+        # Integer label -> notes of the label (1 indicating the MIDI note mod 
+        # 12 is in the label and 0 indicating it is not)
+        self.pitch_classes = np.zeros((n_labels,12),dtype=bool)
+        for name,notes in self.chords.items():
+            self.pitch_classes[self.labels[name],notes] = True
+        # Every accepted spelling -> integer label 
+        self.spellings = dict(self.labels)
+        for sharp,flat in ENHARMONIC.items():
+            for name,label in self.labels.items():
+                if name.startswith(flat):
+                    self.spellings[sharp+name[len(flat):]] = label
+
+    def encode(self,names):
+        ''' Encode Method
+                Converts an array of string labels (in any accepted spelling) 
+                into integer labels. Each distinct string is looked up once. 
+                
+                Args:
+                    names: 1-D Array of string labels; Ex: ['C_M','F#m']
+                           Shape: [n_examples]
+                Returns:
+                    ids: 1-D Numpy Array of integer labels 
+                         Shape: [n_examples]
+        '''
+        names = np.char.strip(np.asarray(names,dtype=str))
+        unique_names,inverse = np.unique(names,return_inverse=True)
+        unknown = [name for name in unique_names if name not in self.spellings]
+        if len(unknown) > 0:
+            raise ValueError('Unknown harmonic labels: '+', '.join(unknown))
+        unique_ids = np.array([self.spellings[name] for name in unique_names],
+                              dtype=np.int64)
+        return unique_ids[inverse.reshape(-1)]
+
+    def decode(self,ids):
+        ''' Decode Method
+                Converts an array of integer labels into string labels 
+                
+                Args:
+                    ids: Array of integer labels 
+                Returns:
+                    names: Array of string labels with the same shape as ids 
+        '''
+        return self.names[np.asarray(ids,dtype=int)]
+
+CODEC = label_codec()
+
+def load_labels(filename=LABELS_FILE,codec=CODEC,cache_dir=None):
+    ''' Load_labels Method
+            Reads the harmonic labels csv file and converts the harmonic labels
+            into the integer labels indicated by the codec 
+            
+            Args:
+                filename: String indicating the path to the harmonic labels csv
+                          file 
+                codec: Label_codec used to convert the harmonic labels 
+                cache_dir: String indicating the path to the cache folder, or 
+                           None to always parse the file 
+            Returns:
+                df_y: 1-D Numpy Array of integer harmonic labels for each event 
+                      Shape: [n_examples]
+                piece_names: 1-D Array of the name of the piece of each event as
+                             strings 
+                             Shape: [n_examples]
+        '''
+    if cache_dir is not None:
+        # The integer labels also depend on the spellings of the codec 
+        path = os.path.join(cache_dir,'labels-'+file_hash(
+            filename,json.dumps(codec.spellings,sort_keys=True))+'.npz')
+        if os.path.exists(path):
+            with np.load(path) as cached:
+                return cached['df_y'],cached['piece_names']
+        df_y,piece_names = load_labels(filename,codec)
+        cache_save(path,np.savez,df_y=df_y,piece_names=piece_names)
+        return df_y,piece_names
+    import pandas
+    # Read the harmonic labels csv file into a Pandas DataFrame, keeping the name
+    # of the piece of each harmonic label 
+    df_y = pandas.read_csv(filename,usecols=[0,16],header=None,skipinitialspace=True)
+    piece_names = np.asarray(df_y[0].values,dtype=str)
+    # Convert all the harmonic labels into integer labels, reducing the number 
+    # of harmonic labels by using enharmonic spellings 
+    y = codec.encode(df_y[16].values)
+    return y,piece_names
+
+def find_pieces(path):
+    ''' Find_pieces Method
+            Finds the files with the MIDI information of the pieces in a folder:
+            the CSV files converted with midicsv if there are any, and otherwise
+            the .mid files 
+            
+            Args:
+                path: String indicating the path to the folder 
+            Returns:
+                filenames: 1-D Array of sorted paths to the files as strings 
+        '''
+    filenames = sorted(glob.glob(os.path.join(path,'*.csv')))
+    if len(filenames) == 0:
+        filenames = sorted(glob.glob(os.path.join(path,'*.mid'))+
+                           glob.glob(os.path.join(path,'*.midi')))
+    return filenames
+
+def load_corpus(corpus_path=CORPUS_PATH,labels_path=LABELS_FILE,processes=None,
+                cache_dir=None,hashes=None):
+    ''' Load_corpus Method
+            Loads the events of every piece in a folder and the corresponding
+            harmonic labels, matched to the pieces by name (the names of the 
+            files without their extensions)
+            
+            Args:
+                corpus_path: String indicating the path to the folder of .csv or
+                             .mid files 
+                labels_path: String indicating the path to the harmonic labels 
+                             csv file 
+                processes: Integer indicating the number of worker processes 
+                           used to load the pieces (see load_chorales)
+                cache_dir: String indicating the path to the cache folder of 
+                           parsed pieces and harmonic labels, or None to parse 
+                           every file 
+                hashes: 2-D Array of the hashes of the pieces in the folder as 
+                        uint8, if already computed (see piece_hashes) 
+            Returns:
+                df_y: 1-D Numpy Array of integer harmonic labels for each event 
+                      Shape: [n_examples]
+                event_codes: 1-D Array of packed events as uint16 (see 
+                             pack_events)
+                             Shape: [n_examples]
+                lengths_list: 1-D Array of indexes into the event_codes array 
+                              where each piece after the first begins 
+                              Shape: [n_pieces-1]
+        '''
+    filenames = find_pieces(corpus_path)
+    event_codes,lengths_list = load_chorales(filenames,processes,cache_dir,hashes)
+    y,piece_names = load_labels(labels_path,cache_dir=cache_dir)
+    piece_rows = {}
+    for index,name in enumerate(piece_names):
+        piece_rows.setdefault(name,[]).append(index)
+    # Select the harmonic labels of the loaded pieces by name, in the order of
+    # the files. A name in the labels file ending in '_' also matches file 
+    # names that replace the '_' (Ex: '001805b_' and '001805bw')
+    stems = [os.path.splitext(os.path.basename(name))[0] for name in filenames]
+    for stem in stems:
+        if stem not in piece_rows:
+            for name in list(piece_rows):
+                if name.endswith('_') and stem.startswith(name.rstrip('_')):
+                    piece_rows[stem] = piece_rows[name]
+                    break
+    missing = [stem for stem in stems if stem not in piece_rows]
+    if len(missing) > 0:
+        raise ValueError('No harmonic labels for the pieces: '+', '.join(missing))
+    # Every piece must have one harmonic label per event
+    piece_lengths = np.diff(np.concatenate(([0],lengths_list,[len(event_codes)])))
+    mismatched = [stem for stem,length in zip(stems,piece_lengths)
+                  if len(piece_rows[stem]) != length]
+    if len(mismatched) > 0:
+        raise ValueError('The number of harmonic labels does not match the number '
+                         'of events of the pieces: '+', '.join(mismatched))
+    rows = [index for stem in stems for index in piece_rows[stem]]
+    df_y = y[np.array(rows,dtype=np.int64)]
+    return df_y,event_codes,lengths_list
+
+def train(corpus_path=CORPUS_PATH,labels_path=LABELS_FILE,processes=None,
+          cache_dir=None,hashes=None):
+    ''' Train Method
+            Generates the transition and emission probability matrices by 
+            training on every piece in a folder 
+            
+            Args:
+                corpus_path: String indicating the path to the folder of .csv or
+                             .mid files 
+                labels_path: String indicating the path to the harmonic labels 
+                             csv file 
+                processes: Integer indicating the number of worker processes 
+                           used to load the pieces (see load_chorales)
+                cache_dir: String indicating the path to the cache folder of 
+                           parsed pieces and harmonic labels, or None to parse 
+                           every file 
+                hashes: 2-D Array of the hashes of the pieces in the folder as 
+                        uint8, if already computed (see piece_hashes) 
+            Returns:
+                model: The fitted hmm_model 
+                df_y: 1-D Numpy Array of integer harmonic labels for each event 
+                      Shape: [n_examples]
+                event_codes: 1-D Array of packed events as uint16 (see 
+                             pack_events)
+                             Shape: [n_examples]
+                lengths_list: 1-D Array of indexes into the event_codes array 
+                              where each piece after the first begins 
+                              Shape: [n_pieces-1]
+        '''
+    df_y,event_codes,lengths_list = load_corpus(corpus_path,labels_path,processes,
+                                                cache_dir,hashes)
+    # Generate the transition and emission probability matrices using the 
+    # packed events (observations) and df_y (states) 
+    model = hmm_model(len(LABELS),12).fit(df_y,event_codes,lengths_list)
+    return model,df_y,event_codes,lengths_list
+
+def save_model(filename,model,df_y,event_codes,lengths_list,hashes=None):
+    ''' Save_model Method
+            Stores the roots and labels dictionaries, the df_y array, the 
+            event_codes array (see pack_events), the lengths_list array, the 
+            trans_mat and emission_mat matrices, the observed transitions of 
+            trans_mat in sparse form (see sparse_matrix), the counts they 
+            were generated from and the hashes of the counted pieces (see 
+            piece_hashes, if given) in a binary model bundle for use by other 
+            programs (see train for the Args; an unpacked 2-D event_list is 
+            also accepted)
+        '''
+    event_codes = np.asarray(event_codes)
+    if event_codes.ndim == 2:
+        event_codes = pack_events(event_codes)
+    trans_sparse = model.trans_sparse
+    arrays = {'df_y':np.asarray(df_y).reshape(-1).astype(np.int64),
+              'event_codes':event_codes.astype(np.uint16),
+              'lengths_list':np.asarray(lengths_list,dtype=np.int64),
+              'trans_mat':model.trans_mat,
+              'emission_mat':model.emission_mat,
+              'trans_indptr':trans_sparse.indptr,
+              'trans_indices':trans_sparse.indices.astype(np.int32),
+              'trans_data':trans_sparse.data,
+              'trans_counts':model.trans_counts,
+              'emission_counts':model.emission_counts,
+              'state_counts':model.state_counts}
+    if hashes is not None:
+        arrays['piece_hashes'] = np.asarray(hashes,dtype=np.uint8).reshape(-1,32)
+    save_model_bundle(filename,ROOTS,LABELS,arrays)
+
+def update_model(filename,corpus_path,labels_path=LABELS_FILE,processes=None,
+                 cache_dir=None):
+    ''' Update_model Method
+            Folds the pieces in a folder into the counts of an existing model 
+            bundle instead of retraining on the whole dataset, and appends them
+            to the stored arrays (see train for the Args). Pieces whose contents
+            are already counted in the bundle (or appear twice in the folder) 
+            are rejected, since they would be counted twice; bundles written 
+            before the hashes of the pieces were stored can only be checked 
+            against the pieces added since 
+            
+            Args:
+                filename: String indicating the path to the model bundle 
+            Returns:
+                model: The updated hmm_model 
+        '''
+    bundle = load_model_bundle(filename)
+    filenames = find_pieces(corpus_path)
+    hashes = piece_hashes(filenames)
+    stored = bundle.get('piece_hashes',np.zeros((0,32),dtype=np.uint8))
+    known = set(bytes(row) for row in stored)
+    counted = []
+    for name,row in zip(filenames,hashes):
+        if bytes(row) in known:
+            counted.append(name)
+        known.add(bytes(row))
+    if len(counted) > 0:
+        raise ValueError('Pieces already counted in the model: '+', '.join(counted))
+    df_y,event_codes,lengths_list = load_corpus(corpus_path,labels_path,processes,
+                                                cache_dir,hashes)
+    model = model_from_bundle(bundle)
+    model.update(split_pieces(df_y,event_codes,lengths_list))
+    n_events = len(bundle['event_codes'])
+    save_model(filename,model,
+               np.concatenate((bundle['df_y'],df_y)),
+               np.concatenate((bundle['event_codes'],event_codes)),
+               np.concatenate((bundle['lengths_list'],[n_events],
+                               n_events + lengths_list)),
+               np.concatenate((stored,hashes)))
+    return model
+
+def main(argv=None):
+    ''' Main Method
+            Command line interface: trains on the given folder (or folds it 
+            into the existing model with --update) and writes the model bundle
+        '''
+    # Argparse takes in the folder of MIDI information for the dataset, which 
+    # holds either CSV files converted with midicsv or the .mid files themselves
+    parser = argparse.ArgumentParser(description='Train HMM')
+    parser.add_argument('path', type = str, nargs = '?', default = CORPUS_PATH,
+                        help = 'Folder of .csv or .mid files of the dataset')
+    parser.add_argument('--update', action = 'store_true',
+                        help = 'Fold the pieces into the counts of the existing model')
+    parser.add_argument('--cache-dir', type = str, default = CACHE_DIR,
+                        help = 'Folder of cached parsed pieces and labels')
+    parser.add_argument('--no-cache', action = 'store_true',
+                        help = 'Parse every file instead of using the cache')
+    args = parser.parse_args(argv)
+    cache_dir = None if args.no_cache else args.cache_dir
+    if args.update:
+        try:
+            update_model(MODEL_BUNDLE,args.path,cache_dir=cache_dir)
+        except ValueError as error:
+            parser.error(str(error))
     else:
-        event_num += 1
-        event_list[event_num] = np.copy(event_list[event_num-1])
-    event_list = update_event_list(all_data,event_list,event_num,ii)
-# Remove all rows with all zeros 
-event_list = event_list[~np.all(event_list==0,axis=1)]
-event_list = event_list.T
-# Convert event_list to 1 (indicating presence of note) and 0 (indicating absence
-# of note)
-event_list[event_list>0] = 1
-
-eps = np.finfo(np.float).eps
-
-# Generate the transition and emission probability matrices using the event_list
-# (observations) and df_y (states) 
-trans_mat = trans_prob(df_y,lengths_list,labels)
-emission_mat = emission_prob(df_y,event_list,labels)
-
-# Convert the roots and labels dictionaries into csv files for use by other programs
-with open('roots.csv','w') as csv_file: 
-    file_writer = csv.writer(csv_file)
-    file_writer.writerow(roots.keys())
-    file_writer.writerow(roots.values())
-
-with open('labels.csv','w') as csv_file:
-    file_writer = csv.writer(csv_file)
-    file_writer.writerow(labels.keys())
-    file_writer.writerow(labels.values())
-
-# Convert the df_y, event_list, and lengths_list arrays into csv files for use 
-# by other programs
-np.savetxt('df_y.csv',np.squeeze(df_y),delimiter=',')
-
-np.savetxt('event_list.csv',event_list,delimiter=',')
-
-np.savetxt('lengths_list.csv',lengths_list,delimiter=',')
-
-# Convert the trans_mat and emission_mat dictionaries into csv files for use 
-# by other programs
-trans_mat_df = pandas.DataFrame.from_dict(trans_mat)
-trans_mat_df.to_csv('trans_mat.csv',index=None)
-
-emission_mat_df = pandas.DataFrame.from_dict(emission_mat)
-emission_mat_df.to_csv('emission_mat.csv',index=None)
+        # Every piece is hashed once, for both the cache keys and the bundle
+        hashes = piece_hashes(find_pieces(args.path))
+        save_model(MODEL_BUNDLE,*train(args.path,cache_dir=cache_dir,hashes=hashes),
+                   hashes=hashes)
 
+if __name__ == '__main__':
+    main()
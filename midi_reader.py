@@ -0,0 +1,132 @@
+'''
+Usage:
+from midi_reader import read_midi
+'''
+# Reads the notes of a Standard MIDI File (.mid) directly, without first
+# converting it to a .csv file with midicsv
+
+import numpy as np
+import struct
+
+def read_varlen(data,pos):
+    ''' Read_varlen Method
+            Decodes a MIDI variable-length quantity (7 bits per byte, with the
+            highest bit of every byte except the last set to 1)
+
+            Args:
+                data: Bytes of the current track chunk
+                pos: Integer indicating the position of the first byte of the
+                     quantity in data
+            Returns:
+                value: Integer value of the quantity
+                pos: Integer indicating the position of the byte following the
+                     quantity in data
+        '''
+    value = 0
+    while True:
+        byte = data[pos]
+        pos += 1
+        value = (value << 7) | (byte & 0x7F)
+        if byte < 0x80:
+            return value,pos
+
+def read_track(data):
+    ''' Read_track Method
+            Decodes the note on/off events of a single track chunk. Meta events,
+            system exclusive events and all other channel events (control
+            changes, program changes, etc.) are skipped while parsing.
+
+            Args:
+                data: Bytes of the track chunk (excluding the chunk header)
+            Returns:
+                times: List of the absolute MIDI times of the note events as ints
+                notes: List of the MIDI note numbers of the note events as ints
+                velocities: List of the velocities of the note events as ints,
+                            where note off events (and note on events with a
+                            velocity of 0) have a velocity of 0
+        '''
+    times = []
+    notes = []
+    velocities = []
+    pos = 0
+    time = 0
+    status = 0
+    length = len(data)
+    while pos < length:
+        delta,pos = read_varlen(data,pos)
+        time += delta
+        byte = data[pos]
+        # Meta event: 0xFF, type, length, data
+        if byte == 0xFF:
+            if data[pos+1] == 0x2F:
+                break
+            size,pos = read_varlen(data,pos+2)
+            pos += size
+            continue
+        # System exclusive event: 0xF0 or 0xF7, length, data
+        if byte == 0xF0 or byte == 0xF7:
+            size,pos = read_varlen(data,pos+1)
+            pos += size
+            continue
+        # A new status byte; otherwise the previous status byte is reused
+        # (running status)
+        if byte & 0x80:
+            status = byte
+            pos += 1
+        elif status == 0:
+            raise ValueError('MIDI data byte without a status byte')
+        kind = status & 0xF0
+        # Program change and channel pressure have a single data byte
+        if kind == 0xC0 or kind == 0xD0:
+            pos += 1
+            continue
+        if kind == 0x90 or kind == 0x80:
+            times.append(time)
+            notes.append(data[pos])
+            velocities.append(data[pos+1] if kind == 0x90 else 0)
+        pos += 2
+    return times,notes,velocities
+
+def read_midi(filename):
+    ''' Read_midi Method
+            Reads the note on/off events of every track in a Standard MIDI File,
+            one track chunk at a time, and merges them in order of time (events
+            at the same time keep the order of their tracks)
+
+            Args:
+                filename: String indicating the path to the .mid file
+            Returns:
+                times: 1-D Array of MIDI times as ints
+                       Shape: [n_rows]
+                notes: 1-D Array of MIDI note numbers as ints
+                       Shape: [n_rows]
+                velocities: 1-D Array of MIDI velocities as ints
+                            Shape: [n_rows]
+        '''
+    times = []
+    notes = []
+    velocities = []
+    with open(filename,'rb') as midifile:
+        chunk_type,size = struct.unpack('>4sI',midifile.read(8))
+        if chunk_type != b'MThd':
+            raise ValueError(filename+' is not a Standard MIDI File')
+        # The format, number of tracks and division are not needed, since
+        # the tracks are merged and times are kept in MIDI ticks
+        midifile.seek(size,1)
+        while True:
+            chunk_header = midifile.read(8)
+            if len(chunk_header) < 8:
+                break
+            chunk_type,size = struct.unpack('>4sI',chunk_header)
+            data = midifile.read(size)
+            # Skip unknown chunk types, as required by the MIDI specification
+            if chunk_type != b'MTrk':
+                continue
+            track_times,track_notes,track_velocities = read_track(data)
+            times.extend(track_times)
+            notes.extend(track_notes)
+            velocities.extend(track_velocities)
+    times = np.array(times,dtype=np.int64)
+    order = np.argsort(times,kind='stable')
+    return (times[order],np.array(notes,dtype=np.int64)[order],
+            np.array(velocities,dtype=np.int64)[order])
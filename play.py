@@ -1,64 +1,321 @@
 '''
 Usage:
-python play.py [duration of playtime as float]
+python play.py [duration of playtime as float] [--seed int]
+python play.py [duration of playtime as float, or inf] --stream
+python play.py [duration as float] --render [number of compositions as int] --output-dir [folder]
 '''
 # Algorithmic Classical Music Generator (Main Program)
 
 import numpy as np
-import pandas
-from midiutil.MidiFile3 import MIDIFile
-import pygame
 import random
 import argparse
+import copy
+import functools
+import io
+import multiprocessing
+import os
+from hmm_trans_emission import (load_model_bundle,label_codec,sparse_matrix,
+                                sparse_from_dense,sparse_trans_from_bundle,
+                                MODEL_BUNDLE)
 
-class harmony:
-    ''' Harmony Class
-            Stores information about the (MIDI) notes in the input label 
+# Possible rhythm duration values of the melody notes, and the duration of 
+# every harmony 
+RHYTHMS = [2.0,1.0,0.5,0.25,1.5]
+HARMONY_DURATION = 2.0
+
+def rhythm_partitions(rhythms=RHYTHMS,total=HARMONY_DURATION):
+    ''' Rhythm_partitions Method
+            Lists every sequence of rhythm duration values filling a harmony, 
+            with the probability of generating it by choosing values uniformly
+            at random and rejecting those that overshoot the harmony (so at 
+            every step, each value that still fits is equally likely) 
             
             Args:
-                label: Integer of the current harmonic label (ranges from 
-                       0 to 143)
-                roots: Dictionary of roots and corresponding MIDI numbers mod 12
-                       Keys: Roots as strings; Ex: 'C_M'
-                       Values: MIDI number mod 12 of root
-                reverse_labels: Dictionary of MIDI numbers mod 12 and 
-                                corresponding roots
-                                Keys: MIDI number mod 12 
-                                Values: Roots as strings; Ex: 'C_M'
+                rhythms: 1-D Array of the possible rhythm duration values 
+                total: Duration of a harmony as float 
+            Returns:
+                partitions: List of tuples of rhythm duration values, each 
+                            summing to total 
+                probs: 1-D Array of the probabilities of the partitions 
+                       Shape: [n_partitions]
+        '''
+    partitions = []
+    probs = []
+    def extend(partition,remaining,prob):
+        if remaining == 0:
+            partitions.append(tuple(partition))
+            probs.append(prob)
+            return
+        fits = [rhythm for rhythm in rhythms if rhythm <= remaining]
+        for rhythm in fits:
+            extend(partition+[rhythm],remaining-rhythm,prob/len(fits))
+    extend([],total,1.0)
+    return partitions,np.array(probs)
+
+RHYTHM_PARTITIONS,RHYTHM_PROBS = rhythm_partitions()
+RHYTHM_CDF = np.cumsum(RHYTHM_PROBS)
+
+def notes_to_midi(notes,tempo,start=0.0):
+    ''' Notes_to_midi Method
+            Writes notes into the two piano tracks of a Standard MIDI File 
+            
+            Args:
+                notes: List of (track, channel, pitch, time, duration, volume) 
+                       tuples of notes, where track 0 is the piano right hand 
+                       and track 1 the piano left hand 
+                tempo: Integer indicating the tempo in beats per minute 
+                start: Time (in beats) of the notes to place at the beginning of
+                       the file 
+            Returns:
+                midi_bytes: Bytes of the Standard MIDI File 
+        '''
+    # midiutil is only imported when a composition is rendered, so that 
+    # importing this module stays fast 
+    from midiutil.MidiFile3 import MIDIFile
+    # Create two MIDI tracks 
+    midi = MIDIFile(2)
+    # Piano right hand track 
+    track = 0
+    time = 0
+    midi.addTrackName(track,time,"Piano Right Hand")
+    midi.addTempo(track,time,tempo)
+    track = 1
+    midi.addTrackName(track,time,"Piano Left Hand")
+    midi.addTempo(track,time,tempo)
+    for track,channel,pitch,time,duration,volume in notes:
+        midi.addNote(track,channel,pitch,time-start,duration,volume)
+    binfile = io.BytesIO()
+    midi.writeFile(binfile)
+    return binfile.getvalue()
+
+class chord_table:
+    ''' Chord_table Class
+            Holds the notes of every harmonic label in read-only arrays, built 
+            once per model, so that the melody and alberti bass look the notes 
+            of a chord up. The added note of a chord is its seventh for seventh
+            chords and its fifth otherwise 
+            
+            Args:
+                codec: Label_codec holding the root (MIDI number mod 12), 
+                       quality, and intervals of every integer label 
     '''
-    def __init__(self,label,roots,reverse_labels):
-        self.reverse_labels = reverse_labels
-        # Using reverse_labels, convert input integer label to 
-        # corresponding string label
-        self.label = list(reverse_labels[label])
-        self.lenlabel = len(self.label)
-        self.roots = roots
-        # Extract the root from the string label 
-        self.root = self.label[0]+self.label[1]
-        self.root = self.roots[self.root]
-        # Extract the quality from the string label 
-        self.quality = self.label[2]
-        # Assign values to self.third and self.fifth 
-        # according to the quality 
-        if self.quality == 'M':
-            self.third = self.root + 4
-            self.fifth = self.root + 7
-        elif self.quality == 'm':
-            self.third = self.root + 3
-            self.fifth = self.root + 7
-        else: 
-            self.third = self.root + 3
-            self.fifth = self.root + 6
-        # If the label indicates a seventh chord, assign
-        # a value to self.add for the corresponding 
-        # MIDI note mod 12 
-        if self.lenlabel == 4 and self.label[3] == '7':
-            self.add = self.root + 10
-        # For the albertibass method, assign self.add 
-        # to self.fifth if not a seventh chord 
-        else:
-            self.add = self.fifth 
-        
+    def __init__(self,codec):
+        self.codec = codec
+        self.n_labels = len(codec.names)
+        self.root = np.asarray(codec.root,dtype=int)
+        self.third = self.root + np.asarray(codec.third,dtype=int)
+        self.fifth = self.root + np.asarray(codec.fifth,dtype=int)
+        # The added note of seventh chords, and the fifth of all other chords
+        # (as used by the alberti bass) 
+        self.add = np.where(np.asarray(codec.added) == '7',
+                            self.root + np.asarray(codec.added_interval,dtype=int),
+                            self.fifth)
+        # Bitmask of the MIDI notes mod 12 of every chord (bit jj is set if 
+        # MIDI note mod 12 jj is in the chord) 
+        self.bitmask = np.zeros(self.n_labels,dtype=np.uint16)
+        for notes in (self.root,self.third,self.fifth,self.add):
+            self.bitmask |= (1 << (notes % 12)).astype(np.uint16)
+        for array in (self.root,self.third,self.fifth,self.add,self.bitmask):
+            array.setflags(write=False)
+        self.octaves = {}
+
+    def octave(self,octave):
+        ''' Octave Method
+                Returns the tables of the notes of every chord in an octave, 
+                building them the first time the octave is requested 
+                
+                Args:
+                    octave: Integer indicating the octave; Ex: 5 (5th octave)
+                Returns:
+                    tables: Dictionary of the tables 
+                            Keys: 'alberti' (2-D Array of the MIDI notes of the
+                                  alberti bass of every chord; Shape: 
+                                  [n_labels,4]), 'tones' (List of tuples of the
+                                  distinct MIDI notes of every chord, in the 
+                                  order used by random choices) and 'in_chord' 
+                                  (2-D boolean Array where in_chord[label,note]
+                                  indicates whether MIDI note is in the chord; 
+                                  Shape: [n_labels,128])
+        '''
+        if octave not in self.octaves:
+            offset = 12*octave
+            # The alberti bass consists of a root, fifth, third, fifth pattern
+            # However, if the harmony is a seventh chord, replace the fifth 
+            # with the seventh 
+            alberti = np.stack((self.root,self.add,self.third,self.add),axis=1) + offset
+            tones = [tuple(set([int(self.root[ii])+offset,int(self.third[ii])+offset,
+                                int(self.fifth[ii])+offset,int(self.add[ii])+offset]))
+                     for ii in range(self.n_labels)]
+            in_chord = np.zeros((self.n_labels,128),dtype=bool)
+            for ii,chord_tones in enumerate(tones):
+                in_chord[ii,list(chord_tones)] = True
+            alberti.setflags(write=False)
+            in_chord.setflags(write=False)
+            self.octaves[octave] = {'alberti':alberti,'tones':tones,'in_chord':in_chord}
+        return self.octaves[octave]
+
+def scale_lookup(scale,octave):
+    ''' Scale_lookup Method
+            Builds a boolean lookup of the MIDI notes of a scale in the octaves
+            around the input octave 
+            
+            Args:
+                scale: 1-D Array of MIDI notes mod 12 in the scale 
+                octave: Integer indicating the octave; Ex: 5 (5th octave)
+            Returns:
+                in_scale: 1-D boolean Array where in_scale[note] indicates 
+                          whether MIDI note is in the scale in octave-1, octave
+                          or octave+1 
+                          Shape: [128]
+    '''
+    in_scale = np.zeros(128,dtype=bool)
+    for n in scale:
+        in_scale[[n + (12*octave),n + (12*(octave-1)),n + (12*(octave+1))]] = True
+    return in_scale
+
+class transition_sampler:
+    ''' Transition_sampler Class
+            Draws the next harmonic label of a progression in constant time. 
+            An alias table (Vose's method) is built once for the observed 
+            successors of every label, so each draw takes a single uniform 
+            random number, one table lookup and one comparison, instead of 
+            validating and summing a whole row of the transition probability 
+            matrix. The uniform random numbers are drawn from a numpy Generator
+            in blocks 
+            
+            Args:
+                trans_sparse: sparse_matrix of the observed transitions (see 
+                              hmm_trans_emission.py)
+                rng: numpy.random.Generator to draw from (defaults to a new,
+                     randomly seeded Generator; see with_rng to share the 
+                     tables between Generators)
+                block: Integer indicating the number of uniform random numbers 
+                       drawn from rng at once 
+    '''
+    def __init__(self,trans_sparse,rng=None,block=1024):
+        self.rng = rng if rng is not None else np.random.default_rng()
+        self.block = block
+        self.trans_sparse = trans_sparse
+        self.n_states = trans_sparse.shape[1]
+        self.indptr = trans_sparse.indptr
+        self.successors = trans_sparse.indices
+        self.n_successors = np.diff(self.indptr)
+        # For the jj-th observed successor of a label, a draw landing in slot
+        # jj keeps the successor with probability threshold[jj] and otherwise 
+        # takes alias[jj] (a label)
+        self.threshold = np.ones(len(self.successors))
+        self.alias = self.successors.copy()
+        for ii in range(trans_sparse.shape[0]):
+            start,end = self.indptr[ii],self.indptr[ii+1]
+            if end > start:
+                self.build_alias(start,end,trans_sparse.data[start:end])
+        self.uniforms = np.zeros(0)
+        self.position = 0
+
+    def build_alias(self,start,end,p):
+        ''' Build_alias Method
+                Builds the alias table of the observed successors of one label 
+                
+                Args:
+                    start, end: Integers indicating the positions of the 
+                                successors in the sparse_matrix 
+                    p: 1-D Array of the transition probabilities to the 
+                       successors (normalized here, since the eps floor of the 
+                       other transitions is left out)
+        '''
+        scaled = np.asarray(p,dtype=float)*len(p)/np.sum(p)
+        small = [jj for jj in range(len(p)) if scaled[jj] < 1]
+        large = [jj for jj in range(len(p)) if scaled[jj] >= 1]
+        while small and large:
+            less = small.pop()
+            more = large[-1]
+            self.threshold[start+less] = scaled[less]
+            self.alias[start+less] = self.successors[start+more]
+            # The remainder of the slot of less is taken from more 
+            scaled[more] -= 1 - scaled[less]
+            if scaled[more] < 1:
+                small.append(large.pop())
+        # Slots left over (only through rounding) keep their own successor 
+        for jj in small + large:
+            self.threshold[start+jj] = 1.0
+
+    def with_rng(self,rng):
+        ''' With_rng Method
+                Returns a sampler sharing the alias tables of this sampler but
+                drawing from another Generator, so that the tables are built 
+                once per model rather than once per composition 
+                
+                Args:
+                    rng: numpy.random.Generator to draw from 
+                Returns:
+                    sampler: Transition_sampler drawing from rng 
+        '''
+        sampler = copy.copy(self)
+        sampler.rng = rng if rng is not None else np.random.default_rng()
+        sampler.uniforms = np.zeros(0)
+        sampler.position = 0
+        return sampler
+
+    def uniform(self):
+        ''' Uniform Method
+                Returns the next uniform random number in [0,1), drawing a new 
+                block from the Generator when the current block is used up 
+        '''
+        if self.position == len(self.uniforms):
+            self.uniforms = self.rng.random(self.block)
+            self.position = 0
+        self.position += 1
+        return self.uniforms[self.position-1]
+
+    def sample(self,state):
+        ''' Sample Method
+                Draws the label following a label 
+                
+                Args:
+                    state: Integer of the current harmonic label 
+                Returns:
+                    next_state: Integer of the next harmonic label (any label is 
+                                equally likely if the current label has no 
+                                observed successor)
+        '''
+        u = self.uniform()
+        n_successors = self.n_successors[state]
+        if n_successors == 0:
+            return int(u*self.n_states)
+        # The integer part of u*n_successors picks a slot and the fractional
+        # part decides between the slot's successor and its alias 
+        x = u*n_successors
+        slot = int(x)
+        position = self.indptr[state] + slot
+        if x - slot < self.threshold[position]:
+            return int(self.successors[position])
+        return int(self.alias[position])
+
+    def sample_batch(self,states):
+        ''' Sample_batch Method
+                Draws the label following each of many labels at once (Ex: one 
+                step of many independent progressions) 
+                
+                Args:
+                    states: 1-D Array of the current harmonic labels as ints 
+                Returns:
+                    next_states: 1-D Array of the next harmonic labels as ints 
+        '''
+        states = np.asarray(states,dtype=int)
+        u = self.rng.random(len(states))
+        uniform_states = (u*self.n_states).astype(int)
+        if len(self.successors) == 0:
+            return uniform_states
+        n_successors = self.n_successors[states]
+        x = u*np.maximum(n_successors,1)
+        slot = x.astype(int)
+        # Labels without observed successors are given a valid position, and
+        # their draws are replaced below 
+        position = np.minimum(self.indptr[states] + slot,len(self.successors)-1)
+        next_states = np.where(x - slot < self.threshold[position],
+                               self.successors[position],self.alias[position])
+        return np.where(n_successors == 0,uniform_states,next_states)
+
 class composition:    
     ''' Composition Class
             Used to algorithmically generate harmonic progressions based off
@@ -74,16 +331,23 @@ class composition:
                         Keys: Harmonies as strings, Ex: 'C_M'
                         Values: Corresponding (arbitrary) integer label
                         ranging from 0 to 143
-                trans_mat: Transition probability matrix dictionary
-                           Keys: Initial States
-                           Values: Dictionaries
-                                   Keys: Final States
-                                   Values: Probability of transitioning from the
-                                   initial states to final states 
+                trans_mat: 2-D Array of transition probabilities, where 
+                           trans_mat[ii][jj] is the probability of transitioning
+                           from initial state ii to final state jj 
+                           Shape: [n_labels,n_labels]
+                           (or the sparse_matrix of the observed transitions, 
+                           or a transition_sampler built once per model, whose
+                           alias tables are then shared)
                 duration: User-input desired duration of composition as float
                           in minutes; Ex: 5.5 (5 and a half minutes)
+                rng: numpy.random.Generator used to sample the harmonic 
+                     progressions and rhythms (defaults to a new, randomly 
+                     seeded Generator)
+                chords: Chord_table of the labels (built from roots if None; 
+                        pass the same table to share it and its label_codec 
+                        between compositions)
     '''
-    def __init__(self,roots,labels,trans_mat,duration):
+    def __init__(self,roots,labels,trans_mat,duration,rng=None,chords=None):
         # Divide input duration by 2 because play method assigns each harmonic
         # label a time duration of 2.0 seconds to construct the composition 
         # (i.e. each harmony lasts for 2 seconds) 
@@ -95,9 +359,25 @@ class composition:
         self.time1 = 0
         self.time2 = 0    
         self.trans_mat = trans_mat
+        # Only the observed transitions are sampled from. A sampler built once
+        # per model only needs to be bound to the Generator of this composition
+        if isinstance(trans_mat,transition_sampler):
+            self.sampler = trans_mat.with_rng(rng)
+        else:
+            if not isinstance(trans_mat,sparse_matrix):
+                trans_mat = sparse_from_dense(trans_mat)
+            self.sampler = transition_sampler(trans_mat,rng)
+        self.trans_sparse = self.sampler.trans_sparse
+        self.rng = self.sampler.rng
         self.labels = labels
-        self.reverse_labels = {y:x for x,y in labels.items()}
         self.roots = roots
+        # The codec converts between string and integer labels and holds the
+        # notes of every label 
+        self.chords = chords if chords is not None else chord_table(label_codec(roots))
+        self.codec = self.chords.codec
+        if self.codec.labels != dict(labels):
+            raise ValueError('labels do not match the labels built from roots')
+        self.reverse_labels = self.codec.reverse_labels
         # Randomly choose a tonic from the available keys and from major ('M') or 
         # minor ('m')
         temp = random.choice([ii for ii in self.roots.keys()])+random.choice(['M','m'])
@@ -131,50 +411,38 @@ class composition:
                                  Shape: [n_labels]
                             
         '''
-        eps = np.finfo(np.float).eps
         progression = []    
         progression.append(self.tonic)
         flag = 0
         index = 0
         # Using the tonic as the first harmonic label in the progression,
-        # use the transition probability matrix and np.random.choice 
-        # to select the next harmonic label in the progression 
+        # use the observed transitions (the values of the transition 
+        # probability matrix above eps) to select the next harmonic label in 
+        # the progression (see transition_sampler)
         while flag == 0:
-            p = [ii for ii in self.trans_mat[progression[index]].values()]
-            # Convert values of eps in the matrix to 0.0 
-            for ii in range(len(p)):
-                if p[ii] <= eps:
-                    p[ii] = 0.0
-            progression.append(np.random.choice(144,1,p=p)[0])
+            progression.append(self.sampler.sample(progression[index]))
             index += 1
             # End the progresion when the tonic is returned to 
             if progression[index] == self.tonic:
                 flag = 1
         return progression
 
-    def albertibass(self,harmony,octave):
+    def albertibass(self,label,octave):
         ''' Albertibass Method 
                 Generates the MIDI notes to be used in the piano left hand alberti 
                 bass line accompanying the current melody 
             
                 Args:
-                    harmony: Harmony class object
+                    label: Integer of the harmonic label (ranges from 0 to 143)
                     octave: Integer indicating the desired octave for the generated
                             MIDI notes; Ex: 5 (5th octave)
                 Returns:
                     chordList: 1-D Array of MIDI note numbers as ints to be used for
-                               the piano left hand part 
+                               the piano left hand part (root, fifth or seventh,
+                               third, fifth or seventh; see chord_table)
                                Shape: [n_notes=4]
         '''
-        chordlist = []
-        # The alberti bass consists of a root, fifth, third, fifth pattern
-        # However, if the harmony is a seventh chord, replace the fifth with 
-        # the seventh 
-        chordlist.extend([harmony.root+(12*octave),
-                          harmony.add+(12*octave),
-                          harmony.third+(12*octave), 
-                          harmony.add+(12*octave)])
-        return chordlist
+        return self.chords.octave(octave)['alberti'][label].tolist()
    
     def rhythmgen(self,progression):
         ''' Rhythmgen Method
@@ -189,27 +457,12 @@ class composition:
                                 be used by the melody 
                                 Shape: [n_notes]
         '''
-        progression = progression
-        # Possible rhythm duration values 
-        rhythms = [2.0,1.0,0.5,0.25,1.5]
-        rhythmlist = []
-        rhythmsublist = []
-        rhythmsum = 0.0
-        # For each harmony, randomly choose values from the rhythms list
-        # until the duration equals 2.0 and add these duration values to 
-        # rhythmsublist. Once the duration equals 2.0, add rhythmsublist
-        # to rhythmlist, initialize rhythmsublist to the empty array and
-        # repeat
-        for n in progression:
-            while(rhythmsum < 2.0):
-                index = random.randint(0,4)
-                if rhythmsum + rhythms[index] <= 2.0:
-                    rhythmsublist.append(rhythms[index])
-                    rhythmsum += rhythms[index]
-            rhythmsum = 0.0
-            rhythmlist.append(rhythmsublist)
-            rhythmsublist = []
-        return rhythmlist
+        # Draw the rhythm of every harmony at once from the precomputed table
+        # of the sequences of rhythm duration values filling a harmony (see 
+        # rhythm_partitions) 
+        draws = self.rng.random(len(progression))*RHYTHM_CDF[-1]
+        indexes = np.searchsorted(RHYTHM_CDF,draws,side='right')
+        return [list(RHYTHM_PARTITIONS[index]) for index in indexes]
 
     def melodygen(self,progression,rhythmlist,scale,octave):
         ''' Melodygen Method
@@ -230,83 +483,106 @@ class composition:
                     melodyList: 1-D Array of melody MIDI note numbers as ints
                                 Shape: [n_notes]
         '''
-        rhythmlist = rhythmlist
-        progression = progression
-        scale = scale
-        scalelist = []
-        # Create a list of possible notes to be used by the melody using the 
-        # scale of the composition 
-        for n in scale: 
-            octaven1 = n + (12*octave)
-            octaven2 = n + (12*(octave-1))
-            octaven3 = n + (12*(octave+1))     
-            scalelist.extend([octaven1,octaven2,octaven3])
+        # Lookups of the possible notes to be used by the melody using the 
+        # scale of the composition, and of the notes of every chord 
+        in_scale = scale_lookup(scale,octave)
+        tables = self.chords.octave(octave)
         # List holding the melody MIDI notes of the composition 
         melodylist = []
         length = len(progression) 
         for m in range(length):
-            harmonylist = []
-            # For every harmony, find the corresponding notes using the 
-            # harmony class and add those notes to harmonylist 
-            chord = harmony(progression[m],self.roots,self.reverse_labels)
-            temp = list(set([chord.root+(12*octave),chord.third+(12*octave),chord.fifth+(12*octave),chord.add+(12*octave)]))
-            harmonylist.extend(temp)
+            # For every harmony, look up the corresponding notes 
+            harmonylist = tables['tones'][progression[m]]
+            in_chord = tables['in_chord'][progression[m]]
             # For every duration value in rhythmlist, assign a melody MIDI note
             for p in rhythmlist[m]:
                 if len(rhythmlist[m]) == 1 or len(melodylist) == 0:
                     # Randomly choose a note from harmonylist
                     melodylist.append(random.choice(harmonylist))
                 else:
-                    if (melodylist[len(melodylist) - 1] - 1) in harmonylist:
-                        melodylist.append(melodylist[len(melodylist) - 1] - 1)
-                    elif (melodylist[len(melodylist) - 1] + 1) in harmonylist: 
-                        melodylist.append(melodylist[len(melodylist) - 1] + 1)
+                    previous = melodylist[-1]
+                    if in_chord[previous - 1]:
+                        melodylist.append(previous - 1)
+                    elif in_chord[previous + 1]: 
+                        melodylist.append(previous + 1)
                     else: 
                         if (random.randint(0,3) == 0):
                             melodylist.append(random.choice(harmonylist))
                         elif (random.randint(0,3) == 1):
-                            if (melodylist[len(melodylist) - 1] - 2) in harmonylist:
-                                melodylist.append(melodylist[len(melodylist) - 1] - 2)
-                            elif (melodylist[len(melodylist) - 1] + 2) in harmonylist:
-                                melodylist.append(melodylist[len(melodylist) - 1] + 2)   
+                            if in_chord[previous - 2]:
+                                melodylist.append(previous - 2)
+                            elif in_chord[previous + 2]:
+                                melodylist.append(previous + 2)   
                             else: 
                                 melodylist.append(random.choice(harmonylist))
                         else:
                             # Add notes that could be outside the scale, but encourage
                             # notes that are one or two steps away from the previous 
                             # note to encourage step-wise up and down motion 
-                            testtone = melodylist[len(melodylist) - 1] 
-                            ncth = testtone + 1
-                            nctl = testtone - 1
-                            ncthh = testtone + 2
-                            nctll = testtone - 2                   
-                            if ncth in scalelist:
-                                melodylist.append(ncth)
-                            elif nctl in scalelist:
-                                melodylist.append(nctl)
-                            elif ncthh in scalelist:
-                                melodylist.append(ncthh)
-                            elif nctll in scalelist:
-                                melodylist.append(nctll)
+                            if in_scale[previous + 1]:
+                                melodylist.append(previous + 1)
+                            elif in_scale[previous - 1]:
+                                melodylist.append(previous - 1)
+                            elif in_scale[previous + 2]:
+                                melodylist.append(previous + 2)
+                            elif in_scale[previous - 2]:
+                                melodylist.append(previous - 2)
                             else:
-                                melodylist.append(testtone)
+                                melodylist.append(previous)
         return melodylist       
 
-    def play(self):
-        ''' Play Method
-                Generates the MIDI tracks necessary to play the composition
-                Plays the composition using pygame module
+    def bassnotes(self,labels,final=False):
+        ''' Bassnotes Method
+                Generates the piano left hand alberti bass notes of harmonies,
+                looking the notes of all the harmonies up at once 
+                
+                Args:
+                    labels: 1-D Array of integer harmonic labels 
+                    final: Boolean indicating whether the last label ends the 
+                           composition (it is then played as a single root)
+                Returns:
+                    notes: List of (track, channel, pitch, time, duration, 
+                           volume) tuples of the notes 
         '''
-        # Create two MIDI tracks 
-        midi = MIDIFile(2)
-        # Piano right hand track 
-        track = 0
-        time = 0
-        midi.addTrackName(track,time,"Piano Right Hand")
-        midi.addTempo(track,time,self.tempo)
+        notes = []
+        # Piano left hand track 
         track = 1
-        midi.addTrackName(track,time,"Piano Left Hand")
-        midi.addTempo(track,time,self.tempo)
+        channel = 0
+        duration = 0.25
+        volume = 80
+        bass = self.chords.octave(4)['alberti'][list(labels)].tolist()
+        for n in range(len(bass)):
+            a = bass[n]
+            if final and n == len(bass) - 1:
+                pitch = a[0]
+                duration = 0.5
+                notes.append((track,channel,pitch,self.time2,duration,volume))
+            else:
+                for iter in range(2):    
+                    for tone in range(4):
+                        pitch = a[tone]
+                        notes.append((track,channel,pitch,self.time2,duration,volume))
+                        self.time2 += 0.25
+        return notes
+
+    def chunks(self):
+        ''' Chunks Method
+                Generates the composition one harmonic progression at a time, 
+                yielding the melody and alberti bass notes of each progression 
+                as soon as they are ready, so that a consumer can render or 
+                play the beginning of the composition while the rest is still 
+                being generated. With an infinite duration (float('inf')), the 
+                composition never ends and the progressions are not kept in 
+                self.compprog, so memory stays bounded 
+                
+                Yields:
+                    notes: List of (track, channel, pitch, time, duration, 
+                           volume) tuples of the notes of a progression, where
+                           track 0 is the piano right hand and track 1 the 
+                           piano left hand (the last chunk holds the final 
+                           tonic)
+        '''
+        unbounded = np.isinf(self.totalbeats)
         while(self.boolean):
             # Create new progressions as long as self.boolean is True 
             progression = self.progressionf()
@@ -324,11 +600,13 @@ class composition:
                     break
             # If the length of the progression is suitable, add it to self.compprog
             if self.totalbeats >= proglength:
-                self.compprog.extend(progression)
+                if not unbounded:
+                    self.compprog.extend(progression)
                 # Subtract length of progression from self.totalbeats (so that 
                 # self.totalbeats keeps track of number of beats left in the 
                 # composition)
                 self.totalbeats -= proglength
+                notes = []
                 track = 0
                 channel = 0
                 volume = 100
@@ -345,36 +623,80 @@ class composition:
                 for n in range(rllength):
                     pitch = melodylist[n]
                     duration = rhythmlist[n]
-                    midi.addNote(track,channel,pitch,self.time1,duration,volume)
+                    notes.append((track,channel,pitch,self.time1,duration,volume))
                     self.time1 += rhythmlist[n]
+                # Add the alberti bass line of the progression 
+                notes.extend(self.bassnotes(progression))
+                yield notes
             # If program fails to generate a progression shorter than self.totalbeats,
             # add the tonic to self.compprog and end the composition 
             else: 
                 self.compprog.append(self.tonic)
                 self.boolean = False
-        # Piano left hand track 
-        track = 1
-        channel = 0
-        duration = 0.25
-        volume = 80
-        # For every harmony in self.compprog, add the alberti bass line 
-        for n in range(len(self.compprog)):
-            a = self.albertibass(harmony(self.compprog[n],self.roots,self.reverse_labels),4)
-            if n == len(self.compprog) - 1:
-                pitch = a[0]
-                duration = 0.5
-                midi.addNote(track,channel,pitch,self.time2,duration,volume) 
-            else:
-                for iter in range(2):    
-                    for tone in range(4):
-                        pitch = a[tone]
-                        midi.addNote(track,channel,pitch,self.time2,
-                                     duration,volume)
-                        self.time2 += 0.25
+                yield self.bassnotes([self.tonic],final=True)
+
+    def generate(self):
+        ''' Generate Method
+                Generates the harmonic progressions, melody and alberti bass of
+                the composition (see chunks)
+                
+                Returns:
+                    notes: List of (track, channel, pitch, time, duration, 
+                           volume) tuples of the notes of the composition, 
+                           where track 0 is the piano right hand and track 1 
+                           the piano left hand 
+        '''
+        if np.isinf(self.totalbeats):
+            raise ValueError('An unbounded composition can only be generated in chunks')
+        notes = []
+        for chunk in self.chunks():
+            notes.extend(chunk)
+        return notes
+
+    def render(self):
+        ''' Render Method
+                Generates the composition and the MIDI tracks necessary to play
+                it, without playing it 
+                
+                Returns:
+                    midi_bytes: Bytes of the Standard MIDI File of the 
+                                composition 
+        '''
+        return notes_to_midi(self.generate(),self.tempo)
+
+    def midi_chunks(self):
+        ''' Midi_chunks Method
+                Generates the composition one harmonic progression at a time 
+                (see chunks), as separate MIDI files whose times start at 0 
+                
+                Yields:
+                    midi_bytes: Bytes of the Standard MIDI File of a chunk 
+        '''
+        for chunk in self.chunks():
+            start = min(note[3] for note in chunk)
+            yield notes_to_midi(chunk,self.tempo,start)
+
+    def write(self,filename):
+        ''' Write Method
+                Generates the composition and writes it to a MIDI file 
+                
+                Args:
+                    filename: String indicating the path of the .mid file 
+        '''
+        midi_bytes = self.render()
+        with open(filename,'wb') as binfile:
+            binfile.write(midi_bytes)
+
+    def play(self):
+        ''' Play Method
+                Generates the MIDI tracks necessary to play the composition
+                Plays the composition using pygame module
+        '''
+        # pygame is only imported when a composition is played 
+        import pygame
         # Write a midi file 
         file = "composition.mid"
-        with open(file,'wb') as binfile:
-            midi.writeFile(binfile)
+        self.write(file)
         # Play the midi file using pygame 
         pygame.init()
         pygame.mixer.init()
@@ -384,26 +706,167 @@ class composition:
         while pygame.mixer.music.get_busy():
             pygame.time.Clock().tick(10)
 
-# Argparse takes in the duration of playtime desired by user as float
-parser = argparse.ArgumentParser()
-parser.add_argument('duration', type = float, help = 'duration of composition')
-args = parser.parse_args()
-       
-# Read in the roots, labels, and trans_mat dictionaries generated
-# by the hmm_trans_emission.py program 
-roots_df = pandas.read_csv('roots.csv')
-roots = roots_df.to_dict(orient='records')
-roots = roots[0]
+    def play_stream(self,filename='composition_chunk'):
+        ''' Play_stream Method
+                Plays the composition using pygame module while it is still 
+                being generated: the first progression starts playing as soon 
+                as it is ready, and each following progression is generated and
+                queued while the previous one plays. Works with an infinite 
+                duration (stop with Ctrl+C) 
+                
+                Args:
+                    filename: String indicating the prefix of the two .mid files
+                              the chunks are written to in turn 
+        '''
+        import pygame
+        pygame.init()
+        pygame.mixer.init()
+        # pygame posts this event every time a file ends (and the queued file 
+        # starts) 
+        end_event = pygame.USEREVENT + 1
+        pygame.mixer.music.set_endevent(end_event)
+        files = [filename+'0.mid',filename+'1.mid']
+        for n,midi_bytes in enumerate(self.midi_chunks()):
+            # The file written now is not in use: the file of the chunk before
+            # the previous one has finished playing 
+            with open(files[n%2],'wb') as binfile:
+                binfile.write(midi_bytes)
+            if n == 0:
+                pygame.mixer.music.load(files[0])
+                pygame.mixer.music.play()
+                continue
+            pygame.mixer.music.queue(files[n%2])
+            # Wait for the previous chunk to end before queueing the next one
+            while not any(event.type == end_event for event in pygame.event.get()):
+                pygame.time.Clock().tick(10)
+        while pygame.mixer.music.get_busy():
+            pygame.time.Clock().tick(10)
 
-labels_df = pandas.read_csv('labels.csv')
-labels = labels_df.to_dict(orient='records')
-labels = labels[0]
+# State of each process rendering compositions for the render_compositions 
+# function: the model bundle is loaded once per process 
+worker_state = {}
+
+def init_worker(filename):
+    ''' Helper function for render_compositions 
+            Loads the roots and labels dictionaries of the model bundle in the 
+            current process, and builds the alias tables of the observed 
+            transitions and the chord tables once for all its compositions 
+            
+            Args:
+                filename: String indicating the path to the model bundle 
+    '''
+    bundle = load_model_bundle(filename)
+    worker_state['roots'] = bundle['roots']
+    worker_state['labels'] = bundle['labels']
+    worker_state['sampler'] = transition_sampler(sparse_trans_from_bundle(bundle))
+    worker_state['chords'] = chord_table(label_codec(bundle['roots']))
 
-trans_mat_df = pandas.read_csv('trans_mat.csv')
-trans_mat = trans_mat_df.to_dict()
-trans_mat = {int(key):trans_mat[key] for key in trans_mat}
+def render_seed(seed,duration,output_dir=None):
+    ''' Helper function for render_compositions 
+            Renders the composition of a seed in the current process 
+            
+            Args:
+                seed: Integer seed of the random choices of the composition 
+                duration: Duration of the composition as float in minutes 
+                output_dir: String indicating the folder to write the .mid file
+                            to, or None to return the MIDI bytes 
+            Returns:
+                result: String path of the written .mid file, or the bytes of 
+                        the MIDI file 
+    '''
+    random.seed(seed)
+    c = composition(worker_state['roots'],worker_state['labels'],
+                    worker_state['sampler'],duration,
+                    np.random.default_rng(seed),worker_state['chords'])
+    if output_dir is None:
+        return c.render()
+    filename = os.path.join(output_dir,'composition_'+str(seed)+'.mid')
+    c.write(filename)
+    return filename
+
+def render_compositions(n_compositions,duration,output_dir=None,seed=0,
+                        processes=None,filename=MODEL_BUNDLE):
+    ''' Render_compositions Method
+            Renders many compositions without playing them, across a pool of 
+            worker processes. Composition ii uses the seed seed+ii, so the 
+            same seeds always give the same compositions 
+            
+            Args:
+                n_compositions: Integer indicating the number of compositions 
+                duration: Duration of each composition as float in minutes 
+                output_dir: String indicating the folder to write the .mid files
+                            to (composition_[seed].mid), or None to return the 
+                            MIDI bytes 
+                seed: Integer seed of the first composition 
+                processes: Integer indicating the number of worker processes 
+                           (defaults to the number of CPUs). If 1, the 
+                           compositions are rendered in the current process. 
+                filename: String indicating the path to the model bundle 
+            Returns:
+                results: List of the paths of the written .mid files, or of the
+                         bytes of the MIDI files, in order of seed 
+    '''
+    # An unbounded composition can only be streamed (see composition.chunks),
+    # so refuse it before any worker process starts
+    if not np.isfinite(duration):
+        raise ValueError('Rendered compositions need a finite duration, not '+str(duration))
+    if output_dir is not None:
+        os.makedirs(output_dir,exist_ok=True)
+    seeds = range(seed,seed+n_compositions)
+    render = functools.partial(render_seed,duration=duration,output_dir=output_dir)
+    if processes == 1 or n_compositions <= 1:
+        init_worker(filename)
+        return [render(ii) for ii in seeds]
+    with multiprocessing.Pool(processes,initializer=init_worker,
+                              initargs=(filename,)) as pool:
+        return pool.map(render,seeds)
+
+def main(argv=None):
+    ''' Main Method
+            Command line interface: generates and plays a composition of the 
+            duration input by the user, or with --render, writes many 
+            compositions to a folder without playing them 
+    '''
+    # Argparse takes in the duration of playtime desired by user as float
+    parser = argparse.ArgumentParser()
+    parser.add_argument('duration', type = float, help = 'duration of composition')
+    parser.add_argument('--seed', type = int, default = None,
+                        help = 'seed of the random choices, to repeat a composition')
+    parser.add_argument('--stream', action = 'store_true',
+                        help = 'start playing before the whole composition is generated')
+    parser.add_argument('--render', type = int, default = None,
+                        help = 'number of compositions to write without playing them')
+    parser.add_argument('--output-dir', type = str, default = 'compositions',
+                        help = 'folder to write the compositions of --render to')
+    parser.add_argument('--processes', type = int, default = None,
+                        help = 'number of worker processes used by --render')
+    args = parser.parse_args(argv)
+    if np.isnan(args.duration) or args.duration == -np.inf:
+        parser.error('duration must be a number or inf')
+    if np.isinf(args.duration) and (args.render is not None or not args.stream):
+        parser.error('a duration of inf can only be played with --stream')
+    if args.render is not None:
+        paths = render_compositions(args.render,args.duration,args.output_dir,
+                                    args.seed or 0,args.processes)
+        print('Wrote '+str(len(paths))+' compositions to '+args.output_dir)
+        return
+    if args.seed is not None:
+        random.seed(args.seed)
 
-c = composition(roots,labels,trans_mat,args.duration)
-c.play()
+    # Read in the roots and labels dictionaries and the observed transitions of
+    # the trans_mat matrix generated by the hmm_trans_emission.py program 
+    bundle = load_model_bundle(MODEL_BUNDLE)
+    roots = bundle['roots']
+    labels = bundle['labels']
+    sampler = transition_sampler(sparse_trans_from_bundle(bundle))
+    chords = chord_table(label_codec(roots))
 
+    c = composition(roots,labels,sampler,args.duration,
+                    np.random.default_rng(args.seed),chords)
+    if args.stream:
+        c.play_stream()
+    else:
+        c.play()
 
+if __name__ == '__main__':
+    main()
@@ -1,16 +1,29 @@
 '''
 Usage:
 python test_hmm.py [number of chorale to test as int]
+python test_hmm.py --evaluate [numbers of chorales to evaluate as ints, default all]
+python test_hmm.py --evaluate --beam [number of states kept per step as int]
+python test_hmm.py --evaluate --posterior
+python test_hmm.py --evaluate --batch
+python test_hmm.py --evaluate --sparse
+python test_hmm.py --evaluate --cross-validate
 '''
 # Program to test HMM
 
 import numpy as np
-import pandas
 import argparse
+import multiprocessing
+import os
+import time
+from hmm_trans_emission import load_model_bundle,model_from_bundle,MODEL_BUNDLE
+from hmm_decode import hmm_decoder
 
 def viterbiL(obs, states, start_p, trans_p, emit_p):
     ''' Viterbi Algorithm in Log-Space
-            Prints HMM predicted labels for the input observations 
+            Finds the HMM predicted labels for the input observations, using 
+            the vectorized decoder in hmm_decode.py (which precomputes the log
+            transition and emission tables). To decode several pieces with 
+            the same HMM, create a single hmm_decoder instead. 
             
             Args:
                 obs: 2-D numpy array of observations, where observations are
@@ -24,144 +37,385 @@ def viterbiL(obs, states, start_p, trans_p, emit_p):
                          probability distribution is uniform
                          Keys: Labels
                          Values: Probabilities 
-                trans_p: Transition probability matrix dictionary
-                         Keys: Initial States
-                         Values: Dictionaries
-                                 Keys: Final States
-                                 Values: Probability of transitioning from the
-                                 initial states to final states 
-                emit_p: Emission probability matrix dictionary
-                        Keys: Current States
-                        Values: Dictionaries
-                                Keys: Observations 
-                                Values: Probability of observing each observation
-                                given the current state. Note that each 
-                                observation's probability, given the current state,
-                                is evaluated independently of the others (i.e. the 
-                                sum of all the values does not equal 1)
+                trans_p: 2-D Array of transition probabilities, where 
+                         trans_p[ii][jj] is the probability of transitioning 
+                         from initial state ii to final state jj 
+                         Shape: [n_labels,n_labels]
+                emit_p: 2-D Array of emission probabilities, where emit_p[ii][jj]
+                        is the probability of observing MIDI note mod 12 jj given
+                        the current state ii. Note that each observation's 
+                        probability, given the current state, is evaluated 
+                        independently of the others (i.e. the sum of all the 
+                        values does not equal 1)
+                        Shape: [n_labels,n_features=12]
+            Returns:
+                opt: 1-D numpy array of the predicted labels as ints 
+                     Shape: [n_examples]
     '''
-    V = [{}]
-    for st in states:
-        V[0][st] = {"prob": np.log2(start_p[st]) + np.log2(obs_to_prob(obs[:,0],st,emit_p)), "prev": None}
-    # Run Viterbi when t > 0
-    for t in range(1, obs.shape[1]):
-        V.append({})
-        for st in states:
-            max_tr_prob = max((V[t-1][prev_st]["prob"]+np.log2(trans_p[prev_st][st])) for prev_st in states)
-            for prev_st in states:
-                if (V[t-1][prev_st]["prob"] + np.log2(trans_p[prev_st][st])) == max_tr_prob:
-                    max_prob = max_tr_prob + np.log2(obs_to_prob(obs[:,t],st,emit_p))
-                    V[t][st] = {"prob": max_prob, "prev": prev_st}
-                    break
-    opt = []
-    # The highest probability
-    max_prob = max(value["prob"] for value in V[-1].values())
-    previous = None
-    # Get most probable state and its backtrack
-    for st, data in V[-1].items():
-        if data["prob"] == max_prob:
-            opt.append(st)
-            previous = st
-            break
-    # Follow the backtrack till the first observation
-    for t in range(len(V) - 2, -1, -1):
-        opt.insert(0, V[t + 1][previous]["prev"])
-        previous = V[t + 1][previous]["prev"]
-    print('The predicted states are: ')
-    print(np.array(opt))
-        
-def obs_to_prob(obs,st,emission_mat):
-    ''' Helper function for viterbiL
-            Converts input observation into an emission probability (probability
-            of observing the observation given the current assumed state) 
-            This is performed by raising the probability of each individual 
-            event in the observation to a power, where the power is the number
-            of times that event occurred in the observation 
-            All of the resulting products are then multiplied to find the 
-            probability of observing all the events in the observation together
-            at the same time 
+    start_p = np.array([start_p[st] for st in states])
+    states = np.asarray(states)
+    decoder = hmm_decoder(np.asarray(trans_p)[np.ix_(states,states)],
+                          np.asarray(emit_p)[states],start_p)
+    return states[decoder.viterbi(obs)]
+
+def chorale_range(lengths_list,n_events,chorale_num):
+    ''' Helper function to look up a chorale 
+            Finds the indexes in event_list of the events of a chorale 
             
             Args:
-                obs: 2-D numpy array of observations, where observations are
-                     the presence/absence of notes (for each of the 12 notes
-                     in the chromatic scale, with 1 indicating presence and 
-                     0 indicating absence)
-                     Shape: [n_features=12,n_examples]  
-                st: Integer of the assumed current state with values ranging
-                    from 0 to 143
-                emit_mat: Emission probability matrix dictionary
-                        Keys: Current States
-                        Values: Dictionaries
-                                Keys: Observations 
-                                Values: Probability of observing each observation
-                                given the current state. Note that each 
-                                observation's probability, given the current state,
-                                is evaluated independently of the others (i.e. the 
-                                sum of all the values does not equal 1)
+                lengths_list: 1-D Array of indexes into the event_list array 
+                              where each piece after the first begins 
+                              Shape: [n_pieces-1]
+                n_events: Integer indicating the total number of events 
+                chorale_num: Integer indicating the number of the chorale, 
+                             ranging from 1 to n_pieces
+            Returns:
+                start: Integer index of the first event of the chorale 
+                end: Integer index after the last event of the chorale 
+    '''
+    # Add the first index (0) of event_list and final index (4703) of event_list
+    # to lengths_list
+    bounds = np.concatenate(([0],lengths_list,[n_events])).astype(int)
+    if chorale_num < 1 or chorale_num >= len(bounds):
+        raise ValueError('chorale_num must range from 1 to '+str(len(bounds)-1))
+    return bounds[chorale_num-1],bounds[chorale_num]
+
+def predict_chorale(bundle,chorale_num):
+    ''' Predict_chorale Method
+            Predicts the labels of a chorale in the dataset using the Viterbi 
+            algorithm 
+            
+            Args:
+                bundle: Dictionary returned by load_model_bundle 
+                chorale_num: Integer indicating the number of the chorale, 
+                             ranging from 1 to n_pieces
             Returns:
-                prob: Float indicating the emission probability of the input 
-                      observation 
+                predicted: 1-D numpy array of the predicted labels as ints 
+                           Shape: [n_examples]
+                correct: 1-D numpy array of the correct labels as ints 
+                         Shape: [n_examples]
+    '''
+    event_codes = bundle['event_codes']
+    start,end = chorale_range(bundle['lengths_list'],len(event_codes),chorale_num)
+    obs = event_codes[start:end]
+    # The start probability distribution is uniform 
+    decoder = hmm_decoder(bundle['trans_mat'],bundle['emission_mat'])
+    predicted = decoder.viterbi(obs)
+    correct = np.asarray(bundle['df_y'][start:end])
+    return predicted,correct
+
+# State of each process decoding chorales for the evaluate function: the model 
+# bundle and decoder are loaded once per process (the arrays of the bundle are 
+# memory-mapped, so all the processes share the same pages)
+worker_state = {}
+
+def init_worker(filename,beam=None,margin=None,posterior=False,
+                cross_validate=False,sparse=False):
+    ''' Helper function for evaluate 
+            Loads the model bundle and creates the decoder of the current 
+            process 
+            
+            Args:
+                filename: String indicating the path to the model bundle 
+                beam, margin: Settings of the beam-pruned Viterbi algorithm (see
+                              hmm_decoder.beam_viterbi); if both are None, the 
+                              exact Viterbi algorithm is used 
+                posterior: Boolean indicating whether to predict the most 
+                           probable label of each event given all the 
+                           observations (see hmm_decoder.posterior_decode) 
+                           instead of the most probable sequence of labels 
+                cross_validate: Boolean indicating whether to decode each 
+                                chorale with a model trained without it (see 
+                                fold_decoder)
+                sparse: Boolean indicating whether to decode with the exact 
+                        Viterbi algorithm scoring only the observed transitions
+                        (see hmm_decoder.sparse_viterbi) 
     '''
-    p = np.array(list(emission_mat[st].values()))
-    p_pow = np.power(p,obs)
-    p_pow = np.prod(p_pow) 
-    prob = p_pow
-    return prob
+    bundle = load_model_bundle(filename)
+    worker_state['bundle'] = bundle
+    worker_state['decoder'] = hmm_decoder(bundle['trans_mat'],bundle['emission_mat'])
+    worker_state['cross_validate'] = cross_validate
+    worker_state['beam'] = beam
+    worker_state['margin'] = margin
+    worker_state['posterior'] = posterior
+    worker_state['sparse'] = sparse
 
-# Argparse takes in the number of the chorale to test as input 
-# Number for chorales ranges from 1 to 50
-parser = argparse.ArgumentParser(description='Test HMM')
-parser.add_argument('chorale_num', type = int, help = 'Number of Chorale to Test')
-args = parser.parse_args()
+def fold_decoder(bundle,start,end):
+    ''' Helper function for evaluate 
+            Creates the decoder of a leave-one-piece-out fold: the counts of 
+            the held-out piece are subtracted from the counts of the whole 
+            dataset stored in the model bundle and the model is re-normalized,
+            which gives the same model as training without the piece 
+            
+            Args:
+                bundle: Dictionary returned by load_model_bundle 
+                start, end: Integers indicating the indexes of the first event 
+                            and one past the last event of the held-out piece 
+            Returns:
+                decoder: hmm_decoder of the model trained without the piece 
+    '''
+    model = model_from_bundle(bundle)
+    model.remove([(bundle['df_y'][start:end],bundle['event_codes'][start:end])])
+    return hmm_decoder(model.trans_mat,model.emission_mat)
 
-# Load in the df_y data generated by the hmm_trans_emission.py program
-df_y = np.genfromtxt('df_y.csv',delimiter=',')
-df_y = [int(x) for x in df_y]
+def decode_chorale(chorale_num):
+    ''' Helper function for evaluate 
+            Decodes a chorale with the decoder of the current process 
+            
+            Args:
+                chorale_num: Integer indicating the number of the chorale, 
+                             ranging from 1 to n_pieces
+            Returns:
+                chorale_num: Integer indicating the number of the chorale 
+                predicted: 1-D numpy array of the predicted labels as ints 
+                correct: 1-D numpy array of the correct labels as ints 
+                seconds: Float indicating the time taken to decode the chorale
+                exact: None, or when decoding with a beam, a tuple of the labels
+                       predicted by the exact Viterbi algorithm, the time taken
+                       by it, and the difference between the log probabilities
+                       (in bits) of the exact and the beam-pruned paths 
+    '''
+    bundle = worker_state['bundle']
+    beam,margin = worker_state['beam'],worker_state['margin']
+    event_codes = bundle['event_codes']
+    start,end = chorale_range(bundle['lengths_list'],len(event_codes),chorale_num)
+    if worker_state['cross_validate']:
+        decoder = fold_decoder(bundle,start,end)
+    else:
+        decoder = worker_state['decoder']
+    obs = event_codes[start:end]
+    correct = np.asarray(bundle['df_y'][start:end])
+    begin = time.perf_counter()
+    if worker_state['posterior']:
+        predicted,_ = decoder.posterior_decode(obs)
+    elif worker_state['sparse']:
+        predicted = decoder.sparse_viterbi(obs)
+    elif beam is None and margin is None:
+        predicted = decoder.viterbi(obs)
+    else:
+        predicted = decoder.beam_viterbi(obs,beam,margin)
+    seconds = time.perf_counter() - begin
+    if beam is None and margin is None:
+        return chorale_num,predicted,correct,seconds,None
+    # Decode exactly as well, to measure how far the beam-pruned result is 
+    # from the exact one 
+    begin = time.perf_counter()
+    exact_path = decoder.viterbi(obs)
+    exact_seconds = time.perf_counter() - begin
+    gap = decoder.log_prob(obs,exact_path) - decoder.log_prob(obs,predicted)
+    return chorale_num,predicted,correct,seconds,(exact_path,exact_seconds,gap)
 
-# Load in the event_list data generated by the hmm_trans_emission.py program
-event_list = np.genfromtxt('event_list.csv',delimiter=',')
+def decode_chorales_batch(chorale_nums):
+    ''' Helper function for evaluate 
+            Decodes many chorales together with the exact Viterbi algorithm in
+            a single batched pass (see hmm_decoder.viterbi_batch), using the 
+            decoder of the current process 
+            
+            Args:
+                chorale_nums: 1-D Array of the numbers of the chorales as ints
+            Returns:
+                results: List of the tuples returned by decode_chorale, one per
+                         chorale (the time of each chorale is its share of the 
+                         total time, in proportion to its number of events)
+    '''
+    bundle = worker_state['bundle']
+    event_codes = bundle['event_codes']
+    ranges = [chorale_range(bundle['lengths_list'],len(event_codes),chorale_num)
+              for chorale_num in chorale_nums]
+    begin = time.perf_counter()
+    paths = worker_state['decoder'].viterbi_batch([event_codes[start:end] 
+                                                   for start,end in ranges])
+    seconds = time.perf_counter() - begin
+    n_events = max(sum(end - start for start,end in ranges),1)
+    return [(chorale_num,path,np.asarray(bundle['df_y'][start:end]),
+             seconds*(end - start)/n_events,None)
+            for chorale_num,path,(start,end) in zip(chorale_nums,paths,ranges)]
 
-# Load in the lengths_list data generated by the hmm_trans_emission.py program
-# Also, add the first index (0) of event_list and final index (4703) of event_list
-# to lengths_list
-lengths_list = np.array([0])
-temp = np.genfromtxt('lengths_list.csv',delimiter=',')
-temp = temp.astype(int)
-lengths_list = np.append(lengths_list,temp)
-lengths_list = np.append(lengths_list,event_list.shape[1])
-# Create a dictionary of indexes corresponding to each piece in the dataset 
-# for easy look-up with the chorale_num from argparse 
-event_dict = {}
-index = 1
-while index < len(lengths_list):
-    value = [lengths_list[index-1],lengths_list[index]-1]
-    event_dict[index] = value
-    index += 1
+def evaluate(filename=MODEL_BUNDLE,chorale_nums=None,processes=None,beam=None,
+             margin=None,posterior=False,batch=False,cross_validate=False,
+             sparse=False):
+    ''' Evaluate HMM on many chorales 
+            Loads the model once per process and decodes the chorales across a 
+            pool of worker processes, comparing the predicted labels with the 
+            correct labels 
+            
+            Args:
+                filename: String indicating the path to the model bundle 
+                chorale_nums: 1-D Array of the numbers of the chorales to decode
+                              as ints (defaults to every chorale)
+                processes: Integer indicating the number of worker processes 
+                           (defaults to the number of CPUs). If 1, the chorales
+                           are decoded in the current process. 
+                beam: Integer indicating the number of states kept per step by 
+                      the beam-pruned Viterbi algorithm (defaults to exact 
+                      decoding)
+                margin: Float indicating the maximum difference (in bits) 
+                        between the scores of the states kept by the beam-pruned
+                        Viterbi algorithm and the best score 
+                posterior: Boolean indicating whether to use posterior decoding
+                           (see init_worker) 
+                batch: Boolean indicating whether to decode all the chorales 
+                       together in the current process, with a single batched
+                       pass of the exact Viterbi algorithm 
+                cross_validate: Boolean indicating whether to hold each chorale
+                                out of training before decoding it 
+                                (leave-one-piece-out cross-validation, with 
+                                the folds built by subtracting counts; see 
+                                fold_decoder) 
+                sparse: Boolean indicating whether to decode with the sparse 
+                        Viterbi algorithm (see init_worker), which gives the 
+                        same labels as exact decoding 
+            Returns:
+                report: Dictionary with the results 
+                        Keys: 'pieces' (list of dictionaries with the 
+                              chorale_num, n_events, n_correct, accuracy and 
+                              seconds of each chorale), 'n_events', 'n_correct',
+                              'accuracy' (over all the events), 'confusion' 
+                              (2-D Array where confusion[ii,jj] is the number of
+                              events with correct label ii predicted as label 
+                              jj), 'seconds' (total time) and 'events_per_second'
+                        With a beam or margin, each piece also has the keys 
+                        'exact_agreement' (fraction of events labeled as by the
+                        exact Viterbi algorithm), 'exact_seconds' and 
+                        'log_prob_gap' (bits lost relative to the exact path), 
+                        and the report has the keys 'exact_agreement', 
+                        'exact_accuracy' and 'speedup' (decoding time of the 
+                        exact algorithm divided by that of the beam) 
+    '''
+    bundle = load_model_bundle(filename)
+    n_states = bundle['trans_mat'].shape[0]
+    if chorale_nums is None:
+        chorale_nums = range(1,len(bundle['lengths_list'])+2)
+    chorale_nums = list(chorale_nums)
+    begin = time.perf_counter()
+    if sparse and (beam is not None or margin is not None or posterior):
+        raise ValueError('Sparse decoding does not support a beam, margin or '
+                         'posterior decoding')
+    if batch:
+        if (beam is not None or margin is not None or posterior or cross_validate
+                or sparse):
+            raise ValueError('Batched decoding only supports the exact Viterbi '
+                             'algorithm with the stored model')
+        init_worker(filename)
+        results = decode_chorales_batch(chorale_nums)
+    elif processes == 1 or len(chorale_nums) <= 1:
+        init_worker(filename,beam,margin,posterior,cross_validate,sparse)
+        results = [decode_chorale(chorale_num) for chorale_num in chorale_nums]
+    else:
+        with multiprocessing.Pool(processes,initializer=init_worker,
+                                  initargs=(filename,beam,margin,posterior,
+                                            cross_validate,sparse)) as pool:
+            chunksize = max(1,len(chorale_nums)//(4*(processes or os.cpu_count() or 1)))
+            results = pool.map(decode_chorale,chorale_nums,chunksize=chunksize)
+    seconds = time.perf_counter() - begin
+    pieces = []
+    confusion = np.zeros((n_states,n_states),dtype=np.int64)
+    for chorale_num,predicted,correct,piece_seconds,exact in results:
+        np.add.at(confusion,(correct,predicted),1)
+        n_correct = int(np.sum(predicted == correct))
+        piece = {'chorale_num':chorale_num,'n_events':len(correct),
+                 'n_correct':n_correct,
+                 'accuracy':n_correct/max(len(correct),1),
+                 'seconds':piece_seconds}
+        if exact is not None:
+            exact_path,exact_seconds,gap = exact
+            piece['n_exact_agree'] = int(np.sum(predicted == exact_path))
+            piece['n_exact_correct'] = int(np.sum(exact_path == correct))
+            piece['exact_agreement'] = piece['n_exact_agree']/max(len(correct),1)
+            piece['exact_seconds'] = exact_seconds
+            piece['log_prob_gap'] = gap
+        pieces.append(piece)
+    n_events = sum(piece['n_events'] for piece in pieces)
+    n_correct = sum(piece['n_correct'] for piece in pieces)
+    report = {'pieces':pieces,'n_events':n_events,'n_correct':n_correct,
+              'accuracy':n_correct/max(n_events,1),'confusion':confusion,
+              'seconds':seconds,'events_per_second':n_events/seconds}
+    if beam is not None or margin is not None:
+        report['exact_agreement'] = sum(piece['n_exact_agree'] 
+                                        for piece in pieces)/max(n_events,1)
+        report['exact_accuracy'] = sum(piece['n_exact_correct'] 
+                                       for piece in pieces)/max(n_events,1)
+        report['speedup'] = (sum(piece['exact_seconds'] for piece in pieces)/
+                             max(sum(piece['seconds'] for piece in pieces),1e-12))
+    return report
 
-# Load in the trans_mat and emission_mat generated by the hmm_trans_emission.py
-# program 
-trans_mat_df = pandas.read_csv('trans_mat.csv')
-trans_mat = trans_mat_df.to_dict()
-trans_mat = {int(key):trans_mat[key] for key in trans_mat}
+def main(argv=None):
+    ''' Main Method
+            Command line interface: prints the predicted and correct labels of 
+            the chorale input by the user, or with --evaluate, the accuracy of 
+            the HMM on many chorales 
+    '''
+    # Argparse takes in the number of the chorale to test as input 
+    # Number for chorales ranges from 1 to 50
+    parser = argparse.ArgumentParser(description='Test HMM')
+    parser.add_argument('chorale_num', type = int, nargs = '*',
+                        help = 'Number of Chorale to Test (or Chorales to Evaluate)')
+    parser.add_argument('--evaluate', action = 'store_true',
+                        help = 'Decode the chorales (default: all) and report accuracy')
+    parser.add_argument('--processes', type = int, default = None,
+                        help = 'Number of worker processes used by --evaluate')
+    parser.add_argument('--beam', type = int, default = None,
+                        help = 'Decode --evaluate with a beam of this many states')
+    parser.add_argument('--margin', type = float, default = None,
+                        help = 'Decode --evaluate keeping states within this many bits of the best')
+    parser.add_argument('--posterior', action = 'store_true',
+                        help = 'Decode --evaluate with the most probable label of each event')
+    parser.add_argument('--batch', action = 'store_true',
+                        help = 'Decode --evaluate in a single batched pass')
+    parser.add_argument('--sparse', action = 'store_true',
+                        help = 'Decode --evaluate scoring only the observed transitions')
+    parser.add_argument('--cross-validate', action = 'store_true',
+                        help = 'Hold each chorale out of training before decoding it in --evaluate')
+    parser.add_argument('--confusion', type = str, default = None,
+                        help = 'CSV file to write the confusion matrix of --evaluate to')
+    args = parser.parse_args(argv)
+    if args.beam is not None and args.beam < 1:
+        parser.error('--beam must be at least 1')
+    if args.margin is not None and args.margin < 0:
+        parser.error('--margin must be at least 0')
+    if args.posterior and (args.beam is not None or args.margin is not None):
+        parser.error('--posterior cannot be combined with --beam or --margin')
+    if args.sparse and (args.posterior or args.beam is not None or args.margin is not None):
+        parser.error('--sparse cannot be combined with --posterior, --beam or --margin')
+    if args.batch and (args.posterior or args.cross_validate or args.sparse
+                       or args.beam is not None or args.margin is not None):
+        parser.error('--batch cannot be combined with --posterior, --cross-validate, '
+                     '--sparse, --beam or --margin')
 
-emission_mat_df = pandas.read_csv('emission_mat.csv')
-emission_mat = emission_mat_df.to_dict()
-emission_mat = {int(key):emission_mat[key] for key in emission_mat}
+    if args.evaluate:
+        report = evaluate(MODEL_BUNDLE,args.chorale_num or None,args.processes,
+                          args.beam,args.margin,args.posterior,args.batch,
+                          args.cross_validate,args.sparse)
+        for piece in report['pieces']:
+            line = 'Chorale {:>3}: {:>4} events, accuracy {:.3f}'.format(
+                   piece['chorale_num'],piece['n_events'],piece['accuracy'])
+            if 'exact_agreement' in piece:
+                line += ', agreement with exact {:.3f}, log prob gap {:.2f} bits'.format(
+                        piece['exact_agreement'],piece['log_prob_gap'])
+            print(line)
+        print('Overall accuracy: {:.3f} ({} of {} events)'.format(
+              report['accuracy'],report['n_correct'],report['n_events']))
+        if 'exact_agreement' in report:
+            print('Exact decoding accuracy: {:.3f}, agreement with exact {:.3f}, '
+                  'speedup {:.2f}x'.format(report['exact_accuracy'],
+                  report['exact_agreement'],report['speedup']))
+        print('Decoded {:.0f} events/second'.format(report['events_per_second']))
+        if args.confusion is not None:
+            np.savetxt(args.confusion,report['confusion'],fmt='%d',delimiter=',')
+        return
+    if len(args.chorale_num) != 1:
+        parser.error('give a single chorale number, or use --evaluate')
 
-# Lookup the indexes in event_list of the chorale_num input by argparse 
-chorale_num = args.chorale_num
-obs = event_list[:,event_dict[chorale_num][0]:event_dict[chorale_num][1]]
-# Generate numpy array of possible states (0-143)
-states = np.arange(144)
-# Generate start probability matrix dictionary where the initial probability
-# distribution is uniform 
-start_p = {}
-for ii in range(144):
-    start_p[ii] = 1/144
-trans_p = trans_mat
-emit_p = emission_mat
-# Print the predicted labels using viterbiL and the correct labels from df_y
-viterbiL(obs,states,start_p,trans_p,emit_p)
-print('The correct states are: ')
-print(np.squeeze(df_y)[event_dict[chorale_num][0]:event_dict[chorale_num][1]])
+    # Load in the df_y, event_codes, lengths_list, trans_mat and emission_mat 
+    # data generated by the hmm_trans_emission.py program
+    bundle = load_model_bundle(MODEL_BUNDLE)
+    # Print the predicted labels using the Viterbi algorithm and the correct 
+    # labels from df_y
+    predicted,correct = predict_chorale(bundle,args.chorale_num[0])
+    print('The predicted states are: ')
+    print(predicted)
+    print('The correct states are: ')
+    print(correct)
 
+if __name__ == '__main__':
+    main()